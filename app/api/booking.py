@@ -12,7 +12,7 @@ async def create_booking(
     booking_service: BookingService = Depends()
 ):
     try:
-        return booking_service.create_booking(booking)
+        return await booking_service.create_booking(booking)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -20,4 +20,4 @@ async def create_booking(
 async def list_bookings(
     booking_service: BookingService = Depends()
 ):
-    return booking_service.get_bookings()
+    return await booking_service.get_bookings()
@@ -0,0 +1,66 @@
+import asyncio
+from typing import Awaitable, Dict, Optional
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+
+from app.core.config import Settings
+from app.core.database import engine, redis_client
+from app.core.embeddings import embedding_registry
+from app.core.vector_store import vector_store
+
+settings = Settings()
+
+health_router = APIRouter()
+
+# Set when background start-up gave up; the instance will never become ready by itself
+_startup_error: Optional[str] = None
+
+
+def mark_startup_failed(error: str):
+    global _startup_error
+    _startup_error = error
+
+
+async def _check_postgres():
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+async def _check(check: Awaitable) -> str:
+    try:
+        await asyncio.wait_for(check, timeout=settings.readiness_timeout)
+    except asyncio.TimeoutError:
+        return "timeout"
+    except Exception as e:
+        return f"error: {e}"
+    return "ok"
+
+
+@health_router.get("/healthz")
+async def liveness():
+    """The process is up and serving; never touches the backends. Fails once background
+    start-up has given up, so the orchestrator restarts the instance"""
+    if _startup_error is not None:
+        return JSONResponse({"status": "failed", "error": _startup_error}, status_code=503)
+    return {"status": "ok"}
+
+
+@health_router.get("/readyz")
+async def readiness():
+    """Ready once the embedding model is warm and Postgres, Redis and the vector store answer"""
+    names = ["postgres", "redis", "vector_store"]
+    results = await asyncio.gather(
+        _check(_check_postgres()),
+        _check(asyncio.to_thread(redis_client.ping)),
+        _check(vector_store.ping()),
+    )
+    checks: Dict[str, str] = dict(zip(names, results))
+    checks["embedding_model"] = "ok" if embedding_registry.is_warm() else "warming up"
+
+    ready = all(result == "ok" for result in checks.values())
+    return JSONResponse(
+        {"status": "ready" if ready else "not ready", "checks": checks},
+        status_code=200 if ready else 503,
+    )
@@ -1,14 +1,17 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from typing import List, Dict, Any
+from typing import Optional
 import uuid
-from sqlalchemy.orm import Session
 from app.services.document_service import DocumentService
 from app.services.chat_service import ChatService
+from app.core.batch_embedder import BatchingEmbedder, get_query_embedder
+from app.core.llm import LLMOverloadedError, OllamaClient, get_llm_client
+from app.core.vector_store import VectorStore, get_vector_store
+from app.core.cache import AnswerCache, QueryEmbeddingCache, get_answer_cache, get_query_embedding_cache
 from app.schemas.chat import ChatRequest, ChatResponse
-from app.schemas.document import DocumentResponse
-from app.core.database import get_db
-from app.models.document import Document, TextChunk
+from app.schemas.document import IngestionJobResponse, IngestionJobStatusResponse
+from app.services.ingestion_jobs import IngestionJobQueue, get_ingestion_queue
 from fastapi import Query
+from fastapi.responses import StreamingResponse
 
 from app.schemas.document import ChunkingStrategy
 
@@ -17,28 +20,73 @@ document_router = APIRouter()
 chat_router = APIRouter()
 
 
-@document_router.post("/upload", response_model=DocumentResponse)
+@document_router.post("/upload", response_model=IngestionJobResponse, status_code=202)
 async def upload_document(
     file: UploadFile = File(...),
     chunking_strategy: ChunkingStrategy = Query(
         default=ChunkingStrategy.RECURSIVE,
-        description="Chunking strategy to use: 'recursive' or 'sentence'"
+        description="Chunking strategy to use: 'recursive', 'sentence' or 'token'"
     ),
-    doc_service: DocumentService = Depends()
+    ingestion_queue: IngestionJobQueue = Depends(get_ingestion_queue)
 ):
 
     if file.filename.endswith(('.pdf', '.txt')):
         try:
-            doc_id = await doc_service.process_file(file, chunking_strategy)
+            job = await ingestion_queue.submit(
+                file.filename,
+                await file.read(),
+                chunking_strategy.value
+            )
             return {
-                "document_id": str(doc_id),
+                "job_id": job["job_id"],
                 "filename": file.filename,
-                "chunking_strategy": chunking_strategy
+                "chunking_strategy": chunking_strategy,
+                "status": job["status"]
             }
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
     raise HTTPException(status_code=400, detail="Only PDF and TXT files are supported")
 
+@document_router.delete("/{document_id}")
+async def delete_document(
+    document_id: int,
+    document_service: DocumentService = Depends()
+):
+    await document_service.delete_document(document_id)
+    return {"document_id": document_id, "status": "deleted"}
+
+@document_router.post("/{document_id}/reindex", response_model=IngestionJobResponse, status_code=202)
+async def reindex_document(
+    document_id: int,
+    chunking_strategy: ChunkingStrategy = Query(
+        default=ChunkingStrategy.RECURSIVE,
+        description="Chunking strategy to use: 'recursive', 'sentence' or 'token'"
+    ),
+    document_service: DocumentService = Depends(),
+    ingestion_queue: IngestionJobQueue = Depends(get_ingestion_queue)
+):
+    document = await document_service.get_document(document_id)
+    if not document_service.has_original(document):
+        raise HTTPException(status_code=409, detail="Original file is not stored, upload the document again")
+
+    job = await ingestion_queue.submit_reindex(document.id, document.filename, chunking_strategy.value)
+    return {
+        "job_id": job["job_id"],
+        "filename": document.filename,
+        "chunking_strategy": chunking_strategy,
+        "status": job["status"]
+    }
+
+@document_router.get("/jobs/{job_id}", response_model=IngestionJobStatusResponse)
+async def get_ingestion_job(
+    job_id: str,
+    ingestion_queue: IngestionJobQueue = Depends(get_ingestion_queue)
+):
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @chat_router.post("/query", response_model=ChatResponse)
 async def chat_query(
     request: ChatRequest,
@@ -52,13 +100,67 @@ async def chat_query(
         # Get response using RAG
         response = await chat_service.get_response(
             query=request.query,
-            conversation_id=conv_id
+            conversation_id=conv_id,
+            retrieval=request.retrieval
         )
         
         return {
             "answer": response["answer"],
             "sources": response["sources"],
-            "conversation_id": conv_id
+            "conversation_id": conv_id,
+            "usage": response.get("usage")
         }
+    except LLMOverloadedError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@chat_router.post("/stream")
+async def chat_stream(
+    request: ChatRequest,
+    chat_service: ChatService = Depends(),
+    llm: OllamaClient = Depends(get_llm_client)
+):
+    # Reject before the stream starts so the client still gets a real status code
+    if llm.is_saturated():
+        raise HTTPException(status_code=429, detail="LLM queue is full, try again later", headers={"Retry-After": "1"})
+
+    conv_id = request.conversation_id or str(uuid.uuid4())
+
+    return StreamingResponse(
+        chat_service.stream_response(query=request.query, conversation_id=conv_id, retrieval=request.retrieval),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Conversation-Id": conv_id}
+    )
+
+
+@chat_router.get("/embedder/stats")
+async def embedder_stats(
+    query_embedder: BatchingEmbedder = Depends(get_query_embedder)
+):
+    return query_embedder.stats()
+
+
+@chat_router.get("/cache/stats")
+async def cache_stats(
+    embedding_cache: QueryEmbeddingCache = Depends(get_query_embedding_cache),
+    answer_cache: Optional[AnswerCache] = Depends(get_answer_cache)
+):
+    return {
+        "query_embeddings": embedding_cache.stats(),
+        "answers": answer_cache.stats() if answer_cache else None
+    }
+
+
+@chat_router.get("/llm/stats")
+async def llm_stats(
+    llm: OllamaClient = Depends(get_llm_client)
+):
+    return llm.stats()
+
+
+@chat_router.get("/search/stats")
+async def search_stats(
+    vector_store: VectorStore = Depends(get_vector_store)
+):
+    return vector_store.stats()
@@ -0,0 +1,125 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import Settings
+from app.core.embeddings import EmbeddingModelRegistry, embedding_registry
+from app.core.telemetry import EMBEDDING_SECONDS, EMBEDDING_TEXTS, timed
+
+settings = Settings()
+
+
+class BatchingEmbedder:
+    """Collects concurrent query embedding requests and encodes them in one batch.
+
+    Callers await ``embed``; a single worker task waits up to ``max_wait_ms`` after the
+    first queued query (or until ``max_batch_size`` queries are queued), runs one batched
+    ``encode`` in a worker thread and resolves every caller's future.
+    """
+
+    def __init__(
+        self,
+        registry: EmbeddingModelRegistry,
+        model_name: Optional[str] = None,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+    ):
+        self.registry = registry
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._batches = 0
+        self._items = 0
+        self._largest_batch = 0
+
+    async def start(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def embed(self, text: str) -> List[float]:
+        await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.registry.backend,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "batches": self._batches,
+            "items": self._items,
+            "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+            "max_batch_size_seen": self._largest_batch,
+        }
+
+    async def _collect_batch(self) -> List[Tuple[str, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued without waiting
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _encode(self, texts: List[str]):
+        # Loading the model can take a while, so the lookup stays off the event loop too
+        return self.registry.get(self.model_name).encode(texts, batch_size=len(texts))
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            # Skip callers that were cancelled while waiting in the queue
+            batch = [(text, future) for text, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            texts = [text for text, _ in batch]
+            try:
+                with timed("embed_batch", EMBEDDING_SECONDS, kind="query"):
+                    vectors = await asyncio.to_thread(self._encode, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self._batches += 1
+            self._items += len(batch)
+            EMBEDDING_TEXTS.labels(kind="query").inc(len(batch))
+            self._largest_batch = max(self._largest_batch, len(batch))
+
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector.tolist())
+
+
+query_embedder = BatchingEmbedder(
+    embedding_registry,
+    max_batch_size=settings.query_batch_max_size,
+    max_wait_ms=settings.query_batch_max_wait_ms,
+)
+
+
+def get_query_embedder() -> BatchingEmbedder:
+    return query_embedder
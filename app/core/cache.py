@@ -0,0 +1,243 @@
+import base64
+import json
+import re
+import threading
+from collections import OrderedDict
+from hashlib import sha1
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import redis
+
+from app.core.config import Settings
+from app.core.database import redis_client
+from app.core.embeddings import embedding_registry
+
+settings = Settings()
+
+
+CORPUS_VERSION_KEY = "corpus:version"
+
+# Words that usually point back at an earlier turn ("what about it?", "and their prices?")
+_FOLLOW_UP_PATTERN = re.compile(
+    r"\b(it|its|this|that|these|those|they|them|their|he|she|him|her|his|"
+    r"above|previous|earlier|same|more|else|also|again)\b|^(and|but|so|what about|how about)\b"
+)
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation so trivial variants share a key"""
+    return re.sub(r"\s+", " ", query).strip().lower().rstrip("?!. ")
+
+
+class QueryEmbeddingCache:
+    """In-process LRU in front of a Redis tier shared by all workers"""
+
+    def __init__(
+        self,
+        redis_client: Optional[redis.Redis],
+        max_size: int = 10000,
+        ttl: int = 86400,
+        dtype: str = "float16",
+    ):
+        self.redis = redis_client
+        self.max_size = max_size
+        self.ttl = ttl
+        self.dtype = np.dtype(dtype)
+        self._local: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def _key(self, query: str, model_name: str) -> str:
+        digest = sha1(f"{model_name}\x00{normalize_query(query)}".encode("utf-8")).hexdigest()
+        return f"emb:query:{digest}"
+
+    def _remember(self, key: str, vector: List[float]):
+        with self._lock:
+            self._local[key] = vector
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+    def get(self, query: str, model_name: Optional[str] = None) -> Optional[List[float]]:
+        key = self._key(query, model_name or embedding_registry.model_id())
+
+        with self._lock:
+            vector = self._local.get(key)
+            if vector is not None:
+                self._local.move_to_end(key)
+                self.local_hits += 1
+                return vector
+
+        raw = None
+        if self.redis is not None:
+            try:
+                raw = self.redis.get(key)
+            except redis.RedisError:
+                raw = None
+
+        if raw is None:
+            self.misses += 1
+            return None
+
+        vector = np.frombuffer(raw, dtype=self.dtype).astype(np.float32).tolist()
+        self.redis_hits += 1
+        self._remember(key, vector)
+        return vector
+
+    def set(self, query: str, vector: List[float], model_name: Optional[str] = None):
+        key = self._key(query, model_name or embedding_registry.model_id())
+        self._remember(key, vector)
+
+        if self.redis is not None:
+            try:
+                self.redis.set(key, np.asarray(vector, dtype=self.dtype).tobytes(), ex=self.ttl)
+            except redis.RedisError:
+                # The local tier still serves this worker
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.local_hits + self.redis_hits + self.misses
+        return {
+            "local_size": len(self._local),
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.local_hits + self.redis_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+def get_corpus_version(redis_client: redis.Redis) -> int:
+    return int(redis_client.get(CORPUS_VERSION_KEY) or 0)
+
+
+def bump_corpus_version(redis_client: redis.Redis) -> int:
+    """Invalidate every cached answer; call after documents are ingested or deleted"""
+    return redis_client.incr(CORPUS_VERSION_KEY)
+
+
+def depends_on_history(query: str, history: List[Dict[str, str]]) -> bool:
+    """Whether earlier turns are likely to change what the query means"""
+    if not history:
+        return False
+    normalized = normalize_query(query)
+    return len(normalized.split()) < 3 or bool(_FOLLOW_UP_PATTERN.search(normalized))
+
+
+class AnswerCache:
+    """Semantic cache of LLM answers.
+
+    An entry is reused when the new query embedding is within ``threshold`` cosine
+    similarity of a cached query and retrieval returned the same chunk IDs. Entries are
+    namespaced by the corpus version, so bumping it invalidates them all at once; callers
+    read it with ``corpus_version`` before retrieval and pass it to ``get`` and ``set``.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        threshold: float = 0.95,
+        ttl: int = 3600,
+        max_entries: int = 32,
+    ):
+        self.redis = redis_client
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    def corpus_version(self) -> Optional[int]:
+        """The current corpus version, or None when Redis is unavailable and the cache should be bypassed"""
+        try:
+            return get_corpus_version(self.redis)
+        except redis.RedisError:
+            return None
+
+    @staticmethod
+    def _key(version: int, chunk_ids: List[str]) -> str:
+        digest = sha1(",".join(sorted(str(chunk_id) for chunk_id in chunk_ids)).encode("utf-8")).hexdigest()
+        return f"answer:cache:{version}:{digest}"
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def get(self, query_vector: List[float], chunk_ids: List[str], version: int) -> Optional[Dict[str, Any]]:
+        try:
+            entries = self.redis.lrange(self._key(version, chunk_ids), 0, -1)
+        except redis.RedisError:
+            entries = []
+
+        if entries:
+            query = self._normalize(query_vector)
+            cached = [json.loads(entry) for entry in entries]
+            vectors = np.stack([
+                np.frombuffer(base64.b64decode(entry["vector"]), dtype=np.float16).astype(np.float32)
+                for entry in cached
+            ])
+            similarities = vectors @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                self.hits += 1
+                return cached[best]["response"]
+
+        self.misses += 1
+        return None
+
+    def set(self, query_vector: List[float], chunk_ids: List[str], response: Dict[str, Any], version: int):
+        """Store an answer under the corpus version it was retrieved from, not the one current now"""
+        entry = json.dumps({
+            "vector": base64.b64encode(self._normalize(query_vector).astype(np.float16).tobytes()).decode("ascii"),
+            "response": response,
+        })
+        key = self._key(version, chunk_ids)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.lpush(key, entry)
+            pipe.ltrim(key, 0, self.max_entries - 1)
+            pipe.expire(key, self.ttl)
+            pipe.execute()
+        except redis.RedisError:
+            pass
+
+    def skip(self):
+        self.skipped += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+query_embedding_cache = QueryEmbeddingCache(
+    redis_client,
+    max_size=settings.query_cache_size,
+    ttl=settings.query_cache_ttl,
+    dtype=settings.query_cache_dtype,
+)
+
+
+def get_query_embedding_cache() -> QueryEmbeddingCache:
+    return query_embedding_cache
+
+
+answer_cache = AnswerCache(
+    redis_client,
+    threshold=settings.answer_cache_threshold,
+    ttl=settings.answer_cache_ttl,
+    max_entries=settings.answer_cache_max_entries,
+)
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    return answer_cache if settings.answer_cache_enabled else None
@@ -1,51 +1,89 @@
-from typing import Optional
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from typing import AsyncIterator, Optional
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from qdrant_client import QdrantClient
-from qdrant_client.http.models.models import Distance, VectorParams
+from qdrant_client.http.models.models import PayloadSchemaType
+import logging
 import redis
 from app.core.config import Settings
-from sentence_transformers import SentenceTransformer
+from app.core.embeddings import embedding_registry
+from app.core.qdrant_profiles import apply_profile, collection_profile, create_collection
+from app.core.telemetry import DB_COMMIT_SECONDS, timed
 
 settings = Settings()
+logger = logging.getLogger(__name__)
 
 # PostgreSQL
-engine = create_engine(settings.postgres_url)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def async_database_url(url: str) -> str:
+    """Point a plain postgresql:// URL at the asyncpg driver"""
+    scheme, _, rest = url.partition("://")
+    if scheme in ("postgresql", "postgres", "postgresql+psycopg2"):
+        return f"postgresql+asyncpg://{rest}"
+    return url
 
-# Qdrant
-qdrant_client = QdrantClient(
-    host=settings.qdrant_host,
-    port=settings.qdrant_port,
-    check_compatibility=False
+engine = create_async_engine(
+    async_database_url(settings.postgres_url),
+    pool_size=settings.postgres_pool_size,
+    max_overflow=settings.postgres_max_overflow,
+    pool_timeout=settings.postgres_pool_timeout,
+    pool_recycle=settings.postgres_pool_recycle,
+    pool_pre_ping=settings.postgres_pool_pre_ping,
 )
+class TimedSession(AsyncSession):
+    """AsyncSession that records how long each commit takes"""
+
+    async def commit(self):
+        with timed("db_commit", DB_COMMIT_SECONDS):
+            await super().commit()
+
+# Objects stay usable after commit, so handlers can return them without another round trip
+SessionLocal = async_sessionmaker(engine, class_=TimedSession, autoflush=False, expire_on_commit=False)
+
+# Qdrant
+if settings.qdrant_local_path == ":memory:":
+    qdrant_client = QdrantClient(location=":memory:")
+elif settings.qdrant_local_path:
+    qdrant_client = QdrantClient(path=settings.qdrant_local_path)
+else:
+    qdrant_client = QdrantClient(
+        host=settings.qdrant_host,
+        port=settings.qdrant_port,
+        grpc_port=settings.qdrant_grpc_port,
+        prefer_grpc=settings.qdrant_prefer_grpc,
+        timeout=settings.qdrant_timeout,
+        check_compatibility=False
+    )
 
 # Initialize Qdrant collection
-def init_qdrant():
-    model = SentenceTransformer(settings.embedding_model)
-    vector_size = model.get_sentence_embedding_dimension()
+def init_qdrant(vector_size: Optional[int] = None):
+    vector_size = vector_size or embedding_registry.dimension()
     
     collections = qdrant_client.get_collections().collections
     exists = any(collection.name == settings.QDRANT_COLLECTION for collection in collections)
     
+    profile = collection_profile()
     if not exists:
-        qdrant_client.create_collection(
+        create_collection(qdrant_client, settings.QDRANT_COLLECTION, vector_size, profile)
+    else:
+        # Qdrant re-optimizes in the background; the collection stays searchable meanwhile
+        changed = apply_profile(qdrant_client, settings.QDRANT_COLLECTION, profile)
+        if changed:
+            logger.info("Updated Qdrant collection %s: %s", settings.QDRANT_COLLECTION, ", ".join(changed))
+
+    # Filtering by document (scoped search, deletes) scans the whole collection without this
+    payload_schema = qdrant_client.get_collection(settings.QDRANT_COLLECTION).payload_schema
+    if "doc_id" not in payload_schema:
+        qdrant_client.create_payload_index(
             collection_name=settings.QDRANT_COLLECTION,
-            vectors_config=VectorParams(
-                size=vector_size,
-                distance=Distance.COSINE
-            )
+            field_name="doc_id",
+            field_schema=PayloadSchemaType.INTEGER
         )
 
 # Redis
 redis_client = redis.Redis.from_url(settings.redis_url)
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db() -> AsyncIterator[AsyncSession]:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 def get_qdrant():
     return qdrant_client
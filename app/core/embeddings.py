@@ -0,0 +1,198 @@
+import json
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from app.core.config import Settings
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+settings = Settings()
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+class EmbeddingModelRegistry:
+    """Loads each embedding model once per process and shares it across requests.
+
+    ``backend`` picks PyTorch, ONNX Runtime, or ONNX with dynamically int8-quantized
+    weights. ONNX models are exported (and quantized) on first use into ``export_dir``
+    and loaded from there afterwards. All backends return ``SentenceTransformer`` objects,
+    so callers encode the same way whichever is configured.
+
+    torch and sentence-transformers are only imported when a model is first loaded. The
+    dimension and max sequence length of every loaded model are cached in
+    ``export_dir/metadata.json``, so a restarted process can size the vector index
+    before (or without) loading the model.
+    """
+
+    def __init__(
+        self,
+        device: Optional[str] = None,
+        num_threads: Optional[int] = None,
+        backend: str = "torch",
+        export_dir: str = "/tmp/rag_models",
+        quantization_config: str = "avx2",
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend: {backend}")
+        self.device = device
+        self.num_threads = num_threads
+        self.backend = backend
+        self.export_dir = export_dir
+        self.quantization_config = quantization_config
+        self._models: Dict[str, "SentenceTransformer"] = {}
+        self._metadata: Optional[Dict[str, Dict[str, Any]]] = None
+        self._warm = False
+        self._lock = threading.Lock()
+
+    @property
+    def metadata_path(self) -> str:
+        return os.path.join(self.export_dir, "metadata.json")
+
+    def _cached_metadata(self) -> Dict[str, Dict[str, Any]]:
+        if self._metadata is None:
+            try:
+                with open(self.metadata_path) as f:
+                    self._metadata = json.load(f)
+            except (OSError, ValueError):
+                self._metadata = {}
+        return self._metadata
+
+    def _remember(self, name: str, model: "SentenceTransformer"):
+        """Record a freshly loaded model's metadata, rewriting the cache file when it changed"""
+        key = self.model_id(name)
+        metadata = {
+            "dimension": model.get_sentence_embedding_dimension(),
+            "max_seq_length": model.max_seq_length,
+        }
+        cached = self._cached_metadata()
+        if cached.get(key) == metadata:
+            return
+        if key in cached:
+            logger.warning("Cached metadata for %s was stale: %s, now %s", key, cached[key], metadata)
+        cached[key] = metadata
+        try:
+            os.makedirs(self.export_dir, exist_ok=True)
+            # Other workers may read the file at any moment, so replace it whole
+            tmp_path = f"{self.metadata_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(cached, f)
+            os.replace(tmp_path, self.metadata_path)
+        except OSError as e:
+            logger.warning("Could not write %s: %s", self.metadata_path, e)
+
+    def _metadata_value(self, name: str, field: str) -> Any:
+        """``field`` of a model, from the metadata cache, loading the model on a miss"""
+        cached = self._cached_metadata().get(self.model_id(name))
+        if cached is None:
+            self.get(name)
+            cached = self._cached_metadata()[self.model_id(name)]
+        return cached[field]
+
+    def get(self, model_name: Optional[str] = None) -> "SentenceTransformer":
+        name = model_name or settings.embedding_model
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        with self._lock:
+            # Another thread may have finished loading while we waited
+            if name not in self._models:
+                model = self._load(name)
+                self._remember(name, model)
+                self._models[name] = model
+            return self._models[name]
+
+    def _load(self, name: str) -> "SentenceTransformer":
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        if self.backend == "torch":
+            return SentenceTransformer(name, device=self.device)
+        import onnxruntime
+
+        path, file_name = self.export(name)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        provider = "CUDAExecutionProvider" if self.device == "cuda" else "CPUExecutionProvider"
+        return SentenceTransformer(
+            path,
+            device=self.device,
+            backend="onnx",
+            model_kwargs={"file_name": file_name, "provider": provider, "session_options": options},
+        )
+
+    def export(self, model_name: Optional[str] = None) -> Tuple[str, str]:
+        """Convert a model for the configured ONNX backend once; returns ``(directory, onnx file)``"""
+        from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+        name = model_name or settings.embedding_model
+        path = os.path.join(self.export_dir, name.replace("/", "--"))
+        file_name = next(
+            (candidate for candidate in ("model.onnx", "onnx/model.onnx") if os.path.exists(os.path.join(path, candidate))),
+            None
+        )
+        if file_name is None:
+            logger.info("Exporting %s to ONNX in %s", name, path)
+            SentenceTransformer(name, device="cpu", backend="onnx", model_kwargs={"export": True}).save_pretrained(path)
+            file_name = "model.onnx" if os.path.exists(os.path.join(path, "model.onnx")) else "onnx/model.onnx"
+        if self.backend != "onnx-int8":
+            return path, file_name
+
+        suffix = f"int8_{self.quantization_config}"
+        quantized = f"onnx/model_{suffix}.onnx"
+        if not os.path.exists(os.path.join(path, quantized)):
+            logger.info("Quantizing %s to int8 (%s)", name, self.quantization_config)
+            model = SentenceTransformer(path, device="cpu", backend="onnx", model_kwargs={"file_name": file_name})
+            export_dynamic_quantized_onnx_model(model, self.quantization_config, path, file_suffix=suffix)
+        return path, quantized
+
+    def model_id(self, model_name: Optional[str] = None) -> str:
+        """Identifies the vectors a model produces, for cache keys; int8 vectors differ slightly from fp32"""
+        name = model_name or settings.embedding_model
+        if self.backend == "onnx-int8":
+            return f"{name}#int8-{self.quantization_config}"
+        return name
+
+    def dimension(self, model_name: Optional[str] = None) -> int:
+        return self._metadata_value(model_name or settings.embedding_model, "dimension")
+
+    def tokenizer(self, model_name: Optional[str] = None):
+        return self.get(model_name).tokenizer
+
+    def max_seq_length(self, model_name: Optional[str] = None) -> int:
+        """Tokens the model reads per input; anything longer is silently truncated"""
+        return self._metadata_value(model_name or settings.embedding_model, "max_seq_length")
+
+    def warmup(self, model_names: Optional[List[str]] = None):
+        """Load the configured models and run one forward pass so the first request is not cold"""
+        for name in model_names or [settings.embedding_model]:
+            self.get(name).encode(["warmup"])
+        self._warm = True
+
+    def is_warm(self) -> bool:
+        return self._warm
+
+    def loaded_models(self) -> List[str]:
+        return list(self._models)
+
+
+embedding_registry = EmbeddingModelRegistry(
+    device=settings.embedding_device,
+    num_threads=settings.embedding_num_threads,
+    backend=settings.embedding_backend,
+    export_dir=settings.embedding_export_dir,
+    quantization_config=settings.embedding_quantization_config,
+)
+
+
+def get_embedding_registry() -> EmbeddingModelRegistry:
+    return embedding_registry
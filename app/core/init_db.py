@@ -1,20 +1,39 @@
-from sqlalchemy import create_engine
-from app.core.config import Settings
-from app.models.document import Base as DocumentBase
+import asyncio
+from sqlalchemy import delete, inspect, select
+from sqlalchemy.schema import AddConstraint
+from app.models.document import Base as DocumentBase, Document, TextChunk
 from app.models.booking import Base as BookingBase
-from app.core.database import init_qdrant
+from app.core.database import engine
+from app.core.embeddings import embedding_registry
+from app.core.vector_store import vector_store
 
-def init_db():
-    settings = Settings()
-    
-    # Initialize tables
-    engine = create_engine(settings.postgres_url)
-    DocumentBase.metadata.create_all(bind=engine)
-    BookingBase.metadata.create_all(bind=engine)
-    
-    # Initialize collection
-    init_qdrant()
+def _add_missing_foreign_keys(conn):
+    existing = {fk["referred_table"] for fk in inspect(conn).get_foreign_keys(TextChunk.__tablename__)}
+    for constraint in TextChunk.__table__.foreign_key_constraints:
+        if constraint.referred_table.name in existing:
+            continue
+        # Rows left behind by deleted documents would make the constraint fail
+        conn.execute(delete(TextChunk).where(TextChunk.document_id.not_in(select(Document.id))))
+        conn.execute(AddConstraint(constraint))
+
+async def init_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(DocumentBase.metadata.create_all)
+        await conn.run_sync(BookingBase.metadata.create_all)
+        # create_all skips tables that already exist, so add indexes and keys introduced since
+        for index in TextChunk.__table__.indexes:
+            await conn.run_sync(index.create, checkfirst=True)
+        await conn.run_sync(_add_missing_foreign_keys)
+
+async def init_vector_index():
+    # Read from the metadata cache; only a cold cache loads the model, and off the event loop
+    dimension = await asyncio.to_thread(embedding_registry.dimension)
+    await vector_store.init(dimension)
+
+async def init_db():
+    """Create or migrate the tables and the vector index, concurrently"""
+    await asyncio.gather(init_tables(), init_vector_index())
 
 if __name__ == "__main__":
-    init_db()
+    asyncio.run(init_db())
     print("Database tables and Qdrant collection created successfully.")
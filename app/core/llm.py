@@ -0,0 +1,180 @@
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+from app.core.config import Settings
+from app.core.telemetry import (
+    LLM_ERRORS, LLM_GENERATION_SECONDS, LLM_QUEUE_SECONDS, LLM_TTFT_SECONDS, observe, timed
+)
+
+settings = Settings()
+
+
+class LLMOverloadedError(Exception):
+    """Raised when a generation cannot be admitted; carries the HTTP status to return"""
+
+    status_code = 503
+
+
+class LLMQueueFullError(LLMOverloadedError):
+    status_code = 429
+
+
+class LLMQueueTimeoutError(LLMOverloadedError):
+    status_code = 503
+
+
+class OllamaClient:
+    """App-lifetime Ollama client with a pooled connection and bounded concurrency.
+
+    At most ``max_in_flight`` generations run at once. Further requests wait in a queue
+    of at most ``max_queue`` entries for up to ``queue_timeout`` seconds; beyond that they
+    are rejected immediately instead of piling onto the single Ollama instance.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        max_in_flight: int = 2,
+        max_queue: int = 32,
+        queue_timeout: float = 30.0,
+        timeout: float = 120.0,
+        max_connections: int = 10,
+    ):
+        self.base_url = base_url
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.total_queue_wait = 0.0
+        self.max_queue_wait = 0.0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def is_saturated(self) -> bool:
+        return self._semaphore.locked() and self.waiting >= self.max_queue
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the in-flight generation slots for the duration of the block"""
+        if self.is_saturated():
+            self.rejected_queue_full += 1
+            LLM_ERRORS.labels(reason="queue_full").inc()
+            raise LLMQueueFullError("LLM queue is full, try again later")
+
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected_timeout += 1
+            LLM_ERRORS.labels(reason="queue_timeout").inc()
+            raise LLMQueueTimeoutError("Timed out waiting for a free LLM slot")
+        finally:
+            self.waiting -= 1
+
+        waited = time.perf_counter() - started
+        observe("llm_queue", waited, LLM_QUEUE_SECONDS)
+        self.total_queue_wait += waited
+        self.max_queue_wait = max(self.max_queue_wait, waited)
+        self.admitted += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def generate(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        async with self.slot():
+            try:
+                with timed("llm_generate", LLM_GENERATION_SECONDS, mode="generate"):
+                    response = await self.client.post("/api/generate", json={**payload, "stream": False})
+                    response.raise_for_status()
+            except httpx.HTTPError:
+                LLM_ERRORS.labels(reason="http").inc()
+                raise
+            return response.json()
+
+    async def stream_generate(self, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """Yield Ollama's streamed JSON lines as they arrive"""
+        async with self.slot():
+            started = time.perf_counter()
+            first_token = True
+            try:
+                async with self.client.stream("POST", "/api/generate", json={**payload, "stream": True}) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
+                        try:
+                            data = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+                        if first_token and (data.get("response") or data.get("done")):
+                            first_token = False
+                            observe("llm_first_token", time.perf_counter() - started, LLM_TTFT_SECONDS)
+                        if data.get("done"):
+                            # Observed before yielding, the caller may stop iterating after the last line
+                            observe("llm_generate", time.perf_counter() - started, LLM_GENERATION_SECONDS, mode="stream")
+                        yield data
+                        if data.get("done"):
+                            break
+            except httpx.HTTPError:
+                LLM_ERRORS.labels(reason="http").inc()
+                raise
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_queue_wait": round(self.total_queue_wait / self.admitted, 4) if self.admitted else 0.0,
+            "max_queue_wait": round(self.max_queue_wait, 4),
+        }
+
+
+llm_client = OllamaClient(
+    settings.ollama_host,
+    max_in_flight=settings.ollama_max_in_flight,
+    max_queue=settings.ollama_max_queue,
+    queue_timeout=settings.ollama_queue_timeout,
+    timeout=settings.ollama_timeout,
+    max_connections=settings.ollama_max_connections,
+)
+
+
+def get_llm_client() -> OllamaClient:
+    return llm_client
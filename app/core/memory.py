@@ -0,0 +1,236 @@
+import logging
+from array import array
+from hashlib import sha1
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+import redis
+
+from app.core.config import Settings
+from app.core.database import redis_client
+from app.core.telemetry import REDIS_HISTORY_SECONDS, timed
+
+settings = Settings()
+logger = logging.getLogger(__name__)
+
+# Messages are stored as a one-character role code followed by the raw content
+_ROLE_CODES = {"user": "u", "assistant": "a", "system": "s"}
+_CODE_ROLES = {code: role for role, code in _ROLE_CODES.items()}
+
+# Append, trim and refresh the TTL in one server-side step. With ARGV[4] == "1", messages
+# trimmed off the front are moved to KEYS[2] for the rolling summary instead of lost;
+# that queue is itself capped at ARGV[5] in case summarising keeps failing.
+# A history written by the earlier chat service (JSON messages, newest first, under the
+# same key) is converted on its first append, keeping its newest ARGV[2] messages, so live
+# conversations survive the upgrade.
+_APPEND_SCRIPT = """
+local first = redis.call('LINDEX', KEYS[1], 0)
+if first and string.sub(first, 1, 1) == '{' then
+    local codes = {user = 'u', assistant = 'a', system = 's'}
+    local legacy = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[2]) - 1)
+    redis.call('DEL', KEYS[1])
+    for i = #legacy, 1, -1 do
+        local message = cjson.decode(legacy[i])
+        redis.call('RPUSH', KEYS[1], (codes[message.role] or 'u') .. (message.content or ''))
+    end
+end
+local length = redis.call('RPUSH', KEYS[1], ARGV[1])
+local overflow = length - tonumber(ARGV[2])
+if overflow > 0 then
+    if ARGV[4] == '1' then
+        local evicted = redis.call('LRANGE', KEYS[1], 0, overflow - 1)
+        redis.call('RPUSH', KEYS[2], unpack(evicted))
+        redis.call('LTRIM', KEYS[2], -tonumber(ARGV[5]), -1)
+        redis.call('EXPIRE', KEYS[2], ARGV[3])
+    end
+    redis.call('LTRIM', KEYS[1], overflow, -1)
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return length
+"""
+
+_APPEND_SHA = sha1(_APPEND_SCRIPT.encode("utf-8")).hexdigest()
+
+Summarizer = Callable[[Optional[str], List[Dict[str, str]]], Awaitable[str]]
+
+
+def encode_message(role: str, content: str) -> bytes:
+    return (_ROLE_CODES.get(role, "u") + content).encode("utf-8")
+
+
+def decode_message(raw: bytes) -> Dict[str, str]:
+    text = raw.decode("utf-8") if isinstance(raw, bytes) else raw
+    return {"role": _CODE_ROLES.get(text[:1], "user"), "content": text[1:]}
+
+
+class ConversationState(NamedTuple):
+    history: List[Dict[str, str]]  # oldest first
+    summary: Optional[str]
+    booking: Optional[bytes]  # raw booking flow state, None when no booking is in progress
+    llm_context: Optional[List[int]]
+
+
+class ConversationMemory:
+    """Bounded per-conversation message log in Redis, read and written in single round trips.
+
+    Each conversation keeps at most ``max_messages`` messages in chronological order.
+    With ``summary_enabled``, trimmed messages are queued and folded into a rolling
+    summary once ``summary_batch`` of them have accumulated.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        ttl: int = 3600,
+        max_messages: int = 20,
+        summary_enabled: bool = False,
+        summary_batch: int = 10,
+    ):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.summary_enabled = summary_enabled
+        self.summary_batch = summary_batch
+
+    def load_scripts(self):
+        """Cache the append script in Redis so pipelines can call it by SHA"""
+        self.redis.script_load(_APPEND_SCRIPT)
+
+    def _execute(self, queue: Callable[[redis.client.Pipeline], None]) -> list:
+        """Run the commands ``queue`` adds in one round trip.
+
+        A registered Script inside a pipeline costs an extra SCRIPT EXISTS round trip on
+        every call, so the script is called with EVALSHA and only loaded when Redis
+        answers NOSCRIPT (not loaded yet, restarted, or failed over).
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        queue(pipe)
+        try:
+            return pipe.execute()
+        except redis.exceptions.NoScriptError:
+            self.load_scripts()
+            # The script failed before it wrote anything, so replaying every command is safe
+            pipe = self.redis.pipeline(transaction=False)
+            queue(pipe)
+            return pipe.execute()
+
+    @staticmethod
+    def _keys(conversation_id: str) -> Dict[str, str]:
+        return {
+            "messages": f"chat:history:{conversation_id}",
+            "evicted": f"chat:evicted:{conversation_id}",
+            "summary": f"chat:summary:{conversation_id}",
+            "summary_lock": f"chat:summary:lock:{conversation_id}",
+            "booking": f"booking:{conversation_id}",
+            "context": f"chat:context:{conversation_id}",
+        }
+
+    def _append_to(self, pipe: redis.client.Pipeline, conversation_id: str, role: str, content: str):
+        keys = self._keys(conversation_id)
+        pipe.evalsha(
+            _APPEND_SHA,
+            2,
+            keys["messages"],
+            keys["evicted"],
+            encode_message(role, content),
+            self.max_messages,
+            self.ttl,
+            int(self.summary_enabled),
+            self.summary_batch * 4,
+        )
+
+    def append(
+        self,
+        conversation_id: str,
+        role: str,
+        content: str,
+        llm_context: Optional[List[int]] = None,
+    ) -> int:
+        """Append a message and return how many trimmed messages await summarising"""
+        keys = self._keys(conversation_id)
+
+        def queue(pipe: redis.client.Pipeline):
+            self._append_to(pipe, conversation_id, role, content)
+            if llm_context:
+                # Packed as int32, a quarter of the size of the JSON list
+                pipe.set(keys["context"], array("i", llm_context).tobytes(), ex=self.ttl)
+            pipe.llen(keys["evicted"])
+
+        with timed("redis_history", REDIS_HISTORY_SECONDS, operation="append"):
+            return self._execute(queue)[-1]
+
+    def append_and_load(
+        self,
+        conversation_id: str,
+        role: str,
+        content: str,
+        max_messages: Optional[int] = None,
+        with_llm_context: bool = False,
+    ) -> ConversationState:
+        """Store the new message and read everything a chat turn needs in one pipeline"""
+        keys = self._keys(conversation_id)
+        count = max_messages or self.max_messages
+
+        def queue(pipe: redis.client.Pipeline):
+            self._append_to(pipe, conversation_id, role, content)
+            pipe.lrange(keys["messages"], -count, -1)
+            pipe.get(keys["summary"])
+            pipe.get(keys["booking"])
+            if with_llm_context:
+                pipe.get(keys["context"])
+
+        with timed("redis_history", REDIS_HISTORY_SECONDS, operation="append_and_load"):
+            results = self._execute(queue)
+
+        summary = results[2].decode("utf-8") if results[2] else None
+        context = results[4] if with_llm_context else None
+        return ConversationState(
+            history=[decode_message(raw) for raw in results[1]],
+            summary=summary,
+            booking=results[3],
+            llm_context=array("i", context).tolist() if context else None,
+        )
+
+    def clear_llm_context(self, conversation_id: str):
+        self.redis.delete(self._keys(conversation_id)["context"])
+
+    async def summarize(self, conversation_id: str, summarizer: Summarizer):
+        """Fold queued evicted messages into the summary; a no-op below ``summary_batch``"""
+        if not self.summary_enabled:
+            return
+        keys = self._keys(conversation_id)
+        # One summariser per conversation at a time; the lock expires if a worker dies
+        if not self.redis.set(keys["summary_lock"], 1, nx=True, ex=60):
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.lrange(keys["evicted"], 0, -1)
+            pipe.get(keys["summary"])
+            evicted, summary = pipe.execute()
+            if len(evicted) < self.summary_batch:
+                return
+
+            messages = [decode_message(raw) for raw in evicted]
+            summary = await summarizer(summary.decode("utf-8") if summary else None, messages)
+
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.set(keys["summary"], summary, ex=self.ttl)
+            # Only drop what was summarised, messages evicted meanwhile stay queued
+            pipe.ltrim(keys["evicted"], len(evicted), -1)
+            pipe.execute()
+        except Exception:
+            logger.exception("Summarising conversation %s failed", conversation_id)
+        finally:
+            self.redis.delete(keys["summary_lock"])
+
+
+conversation_memory = ConversationMemory(
+    redis_client,
+    ttl=settings.chat_history_ttl,
+    max_messages=settings.chat_history_max_messages,
+    summary_enabled=settings.chat_summary_enabled,
+    summary_batch=settings.chat_summary_batch,
+)
+
+
+def get_conversation_memory() -> ConversationMemory:
+    return conversation_memory
@@ -0,0 +1,448 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+from qdrant_client.models import ScoredPoint
+
+from app.core.vector_store import Vector, VectorPoint, VectorStore
+
+logger = logging.getLogger(__name__)
+
+# Rows scored per matrix product, bounds the float32 copy made of a float16 index
+BLOCK_ROWS = 65536
+WRITE_BATCH = 1024
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def train_centroids(vectors: np.ndarray, lists: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means: unit-length centroids for cosine similarity"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), lists, replace=False)].copy()
+    for _ in range(iterations):
+        assigned = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assigned, vectors)
+        empty = ~sums.any(axis=1)
+        # Re-seed partitions that lost all their members
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids
+
+
+class MmapVectorStore(VectorStore):
+    """Embedded vector index: unit vectors in a memory-mapped file, searched with NumPy.
+
+    Files under ``path``, where ``g`` is bumped by every compaction:
+
+    - ``manifest.json``: dimension, dtype, generation and the committed row and log sizes
+    - ``vectors-g.bin``: one row per added point, row-major ``dtype``
+    - ``log-g.jsonl``: the ID/payload sidecar, an ``add`` line per row and ``del`` lines
+      naming rows that were replaced or deleted
+    - ``centroids-g.npy``: IVF partitions, trained once ``ivf_min_points`` vectors are live
+
+    Search is exact (blocked matrix products) until IVF is trained, then scores only the
+    ``ivf_probe`` partitions nearest the query. Writers serialise on an ``flock``; every
+    process maps the same files read-only, so workers share one copy in the page cache
+    and see each other's writes on their next search.
+    """
+
+    name = "mmap"
+
+    def __init__(
+        self,
+        path: str,
+        dtype: str = "float32",
+        ivf_min_points: int = 0,
+        ivf_lists: Optional[int] = None,
+        ivf_probe: int = 8,
+        compact_ratio: float = 0.3,
+    ):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        self.path = path
+        self.dtype = dtype
+        self.ivf_min_points = ivf_min_points
+        self.ivf_lists = ivf_lists
+        self.ivf_probe = ivf_probe
+        self.compact_ratio = compact_ratio
+        self.dimension: Optional[int] = None
+        self.searches = 0
+        self._lock = threading.RLock()
+        self._manifest: Dict[str, Any] = {}
+        self._manifest_key = None
+        self._reset(None)
+
+    def _reset(self, generation: Optional[int]):
+        # Not closed explicitly: a search still reading payloads may hold the old file
+        self.generation = generation
+        self._log_file = None
+        self._log_offset = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._id_rows: Dict[str, int] = {}
+        self._doc_ids = np.zeros(0, dtype=np.int64)
+        self._lists = np.zeros(0, dtype=np.int32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._line_offsets = np.zeros(0, dtype=np.int64)
+        self._line_lengths = np.zeros(0, dtype=np.int64)
+        self._centroids: Optional[np.ndarray] = None
+
+    def _file(self, kind: str, generation: int) -> str:
+        suffix = {"vectors": "bin", "log": "jsonl", "centroids": "npy"}[kind]
+        return os.path.join(self.path, f"{kind}-{generation}.{suffix}")
+
+    @property
+    def _manifest_path(self) -> str:
+        return os.path.join(self.path, "manifest.json")
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        # Readers only ever see a complete manifest
+        tmp_path = self._manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._manifest_path)
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[Dict[str, Any]]:
+        """Exclusive across threads and processes; yields the up-to-date manifest"""
+        with self._lock, open(os.path.join(self.path, "lock"), "a+") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                yield dict(self._manifest)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    async def init(self, dimension: int):
+        await asyncio.to_thread(self._init, dimension)
+
+    def _init(self, dimension: int):
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock, open(os.path.join(self.path, "lock"), "a+") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if not os.path.exists(self._manifest_path):
+                    for kind in ("vectors", "log"):
+                        open(self._file(kind, 0), "wb").close()
+                    self._write_manifest({
+                        "dimension": dimension, "dtype": self.dtype, "generation": 0,
+                        "rows": 0, "log_bytes": 0, "deleted": 0, "ivf_trained_rows": 0,
+                    })
+                with open(self._manifest_path) as f:
+                    manifest = json.load(f)
+                if manifest["dimension"] != dimension:
+                    raise ValueError(
+                        f"{self.path} holds {manifest['dimension']}-dimensional vectors but the embedding "
+                        f"model produces {dimension}; remove it and re-index the documents"
+                    )
+                if manifest["dtype"] != self.dtype:
+                    logger.warning("%s stores %s vectors, ignoring dtype %s", self.path, manifest["dtype"], self.dtype)
+                # Drop anything a crashed writer appended past the committed sizes
+                generation = manifest["generation"]
+                row_bytes = dimension * np.dtype(manifest["dtype"]).itemsize
+                os.truncate(self._file("vectors", generation), manifest["rows"] * row_bytes)
+                os.truncate(self._file("log", generation), manifest["log_bytes"])
+                self._refresh()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """Catch up with writes committed by this or any other process"""
+        with self._lock:
+            stat = os.stat(self._manifest_path)
+            key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if key == self._manifest_key:
+                return
+            with open(self._manifest_path) as f:
+                manifest = json.load(f)
+            self._manifest = manifest
+            self._manifest_key = key
+            self.dimension = manifest["dimension"]
+            self.dtype = manifest["dtype"]
+
+            generation = manifest["generation"]
+            try:
+                if generation != self.generation:
+                    self._reset(generation)
+                    self._log_file = open(self._file("log", generation), "rb", buffering=0)
+                    if os.path.exists(self._file("centroids", generation)):
+                        self._centroids = np.load(self._file("centroids", generation))
+
+                self._read_log(manifest["log_bytes"])
+                rows = manifest["rows"]
+                if rows:
+                    self._vectors = np.memmap(
+                        self._file("vectors", generation), dtype=self.dtype, mode="r", shape=(rows, self.dimension)
+                    )
+            except FileNotFoundError:
+                # Compacted away between reading the manifest and opening its files
+                self._reset(None)
+                self._manifest_key = None
+                self._refresh()
+
+    def _read_log(self, log_bytes: int):
+        if log_bytes <= self._log_offset:
+            return
+        data = os.pread(self._log_file.fileno(), log_bytes - self._log_offset, self._log_offset)
+        doc_ids, lists, offsets, lengths, deleted = [], [], [], [], []
+        position = 0
+        for line in data.splitlines(keepends=True):
+            record = json.loads(line)
+            if record["op"] == "add":
+                row = len(self._ids)
+                self._ids.append(record["id"])
+                self._id_rows[record["id"]] = row
+                doc_id = record["payload"].get("doc_id")
+                doc_ids.append(-1 if doc_id is None else doc_id)
+                lists.append(record.get("list", -1))
+                offsets.append(self._log_offset + position)
+                lengths.append(len(line))
+            else:
+                for row in record["rows"]:
+                    deleted.append(row)
+                    if self._id_rows.get(self._ids[row]) == row:
+                        del self._id_rows[self._ids[row]]
+            position += len(line)
+
+        self._doc_ids = np.concatenate([self._doc_ids, np.asarray(doc_ids, dtype=np.int64)])
+        self._lists = np.concatenate([self._lists, np.asarray(lists, dtype=np.int32)])
+        self._line_offsets = np.concatenate([self._line_offsets, np.asarray(offsets, dtype=np.int64)])
+        self._line_lengths = np.concatenate([self._line_lengths, np.asarray(lengths, dtype=np.int64)])
+        self._alive = np.concatenate([self._alive, np.ones(len(doc_ids), dtype=bool)])
+        self._alive[deleted] = False
+        self._log_offset = log_bytes
+
+    def _record(self, row: int, log_file=None, offsets=None, lengths=None) -> Dict[str, Any]:
+        log_file = log_file or self._log_file
+        offsets = self._line_offsets if offsets is None else offsets
+        lengths = self._line_lengths if lengths is None else lengths
+        return json.loads(os.pread(log_file.fileno(), int(lengths[row]), int(offsets[row])))
+
+    def _row_vectors(self, rows: np.ndarray) -> np.ndarray:
+        return np.asarray(self._vectors[rows], dtype=np.float32)
+
+    async def search(self, vector, top_k=3, document_ids=None):
+        return (await self.search_batch([vector], top_k, document_ids))[0]
+
+    async def search_batch(self, vectors, top_k=3, document_ids=None):
+        if not vectors:
+            return []
+        return await asyncio.to_thread(self._search, vectors, top_k, document_ids)
+
+    def _search(self, vectors: List[Vector], top_k: int, document_ids: Optional[List[int]]) -> List[List[ScoredPoint]]:
+        with self._lock:
+            self._refresh()
+            self.searches += len(vectors)
+            index = self._vectors
+            count = len(self._ids)
+            mask = self._alive[:count].copy()
+            lists = self._lists[:count]
+            centroids = self._centroids
+            doc_ids = self._doc_ids
+            # Held on to so a concurrent compaction cannot pull the payloads from under us
+            sidecar = (self._ids, self._log_file, self._line_offsets, self._line_lengths)
+
+        queries = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1))
+        if document_ids:
+            mask &= np.isin(doc_ids[:count], document_ids)
+        if index is None or not mask.any():
+            return [[] for _ in vectors]
+
+        # A document filter already narrows the candidates, IVF could only lose some of them
+        if centroids is not None and not document_ids:
+            results = [self._search_ivf(index, query, mask, lists, centroids, top_k) for query in queries]
+        else:
+            results = self._search_exact(index, queries, mask, top_k)
+
+        ids, log_file, offsets, lengths = sidecar
+        return [
+            [
+                ScoredPoint(
+                    id=ids[row], version=0, score=float(score),
+                    payload=self._record(row, log_file, offsets, lengths)["payload"],
+                )
+                for row, score in hits
+            ]
+            for hits in results
+        ]
+
+    def _search_exact(self, index: np.ndarray, queries: np.ndarray, mask: np.ndarray, top_k: int):
+        count = len(mask)
+        scores = np.empty((len(queries), count), dtype=np.float32)
+        for start in range(0, count, BLOCK_ROWS):
+            block = np.asarray(index[start:start + BLOCK_ROWS], dtype=np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        scores[:, ~mask] = -np.inf
+        k = min(top_k, int(mask.sum()))
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for query_scores, rows in zip(scores, best):
+            rows = rows[np.argsort(-query_scores[rows])]
+            results.append(list(zip(rows.tolist(), query_scores[rows].tolist())))
+        return results
+
+    def _search_ivf(self, index, query, mask, lists, centroids, top_k):
+        probe = min(self.ivf_probe, len(centroids))
+        nearest = np.argpartition(-(centroids @ query), probe - 1)[:probe]
+        rows = np.flatnonzero(mask & np.isin(lists, nearest))
+        if len(rows) < top_k:
+            return self._search_exact(index, query[None, :], mask, top_k)[0]
+        scores = self._row_vectors(rows) @ query
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return list(zip(rows[best].tolist(), scores[best].tolist()))
+
+    async def upsert(self, points: List[VectorPoint], on_batch: Optional[Callable[[int], None]] = None):
+        await asyncio.to_thread(self._upsert, points, on_batch)
+
+    def _upsert(self, points: List[VectorPoint], on_batch: Optional[Callable[[int], None]] = None):
+        for start in range(0, len(points), WRITE_BATCH):
+            batch = points[start:start + WRITE_BATCH]
+            with self._write_lock() as manifest:
+                vectors = _normalize(np.asarray([np.asarray(point.vector, dtype=np.float32) for point in batch]))
+                lists = (
+                    np.argmax(vectors @ self._centroids.T, axis=1).tolist()
+                    if self._centroids is not None else [-1] * len(batch)
+                )
+                # Upserting an existing id replaces its row, as Qdrant would
+                replaced = []
+                rows = dict(self._id_rows)
+                for offset, point in enumerate(batch):
+                    if point.id in rows:
+                        replaced.append(rows[point.id])
+                    rows[point.id] = manifest["rows"] + offset
+
+                lines = [
+                    json.dumps({"op": "add", "id": point.id, "list": list_id, "payload": point.payload})
+                    for point, list_id in zip(batch, lists)
+                ]
+                if replaced:
+                    lines.append(json.dumps({"op": "del", "rows": replaced}))
+                self._append(manifest, vectors, lines, len(batch), len(replaced))
+            if on_batch:
+                on_batch(len(batch))
+        self._maintain()
+
+    async def delete_document(self, document_id: int):
+        await asyncio.to_thread(self._delete_document, document_id)
+
+    def _delete_document(self, document_id: int):
+        with self._write_lock() as manifest:
+            count = len(self._ids)
+            rows = np.flatnonzero(self._alive[:count] & (self._doc_ids[:count] == document_id)).tolist()
+            if not rows:
+                return
+            self._append(manifest, None, [json.dumps({"op": "del", "rows": rows})], 0, len(rows))
+        self._maintain()
+
+    def _append(self, manifest: Dict[str, Any], vectors: Optional[np.ndarray], lines: List[str], added: int, deleted: int):
+        """Write at the committed offsets, then commit by replacing the manifest"""
+        generation = manifest["generation"]
+        if vectors is not None and len(vectors):
+            row_bytes = manifest["dimension"] * np.dtype(manifest["dtype"]).itemsize
+            with open(self._file("vectors", generation), "r+b") as f:
+                f.seek(manifest["rows"] * row_bytes)
+                f.write(vectors.astype(manifest["dtype"]).tobytes())
+                f.truncate()
+        data = "".join(line + "\n" for line in lines).encode("utf-8")
+        with open(self._file("log", generation), "r+b") as f:
+            f.seek(manifest["log_bytes"])
+            f.write(data)
+            f.truncate()
+        manifest.update(
+            rows=manifest["rows"] + added,
+            log_bytes=manifest["log_bytes"] + len(data),
+            deleted=manifest["deleted"] + deleted,
+        )
+        self._write_manifest(manifest)
+        self._refresh()
+
+    def _maintain(self):
+        """Compact once enough rows are dead, and (re)train IVF as the index grows"""
+        with self._write_lock() as manifest:
+            rows = manifest["rows"]
+            live = rows - manifest["deleted"]
+            retrain = (
+                bool(self.ivf_min_points) and live >= self.ivf_min_points
+                and live >= 2 * manifest["ivf_trained_rows"]
+            )
+            if retrain or (rows and manifest["deleted"] / rows > self.compact_ratio):
+                self._compact(manifest, retrain)
+
+    def _compact(self, manifest: Dict[str, Any], train: bool):
+        """Rewrite live rows into a new generation; the caller holds the write lock"""
+        count = len(self._ids)
+        alive = np.flatnonzero(self._alive[:count])
+        generation = manifest["generation"] + 1
+
+        centroids = self._centroids
+        if train and len(alive):
+            lists = self.ivf_lists or max(int(np.sqrt(len(alive))), 1)
+            sample = np.random.default_rng(0).choice(alive, min(len(alive), lists * 64), replace=False)
+            centroids = train_centroids(self._row_vectors(np.sort(sample)), min(lists, len(sample)))
+            np.save(self._file("centroids", generation), centroids)
+        elif centroids is not None:
+            np.save(self._file("centroids", generation), centroids)
+
+        log_bytes = 0
+        with open(self._file("vectors", generation), "wb") as vector_file, \
+                open(self._file("log", generation), "wb") as log_file:
+            for start in range(0, len(alive), BLOCK_ROWS):
+                rows = alive[start:start + BLOCK_ROWS]
+                block = np.asarray(self._vectors[rows])
+                vector_file.write(block.tobytes())
+                assigned = (
+                    np.argmax(block.astype(np.float32) @ centroids.T, axis=1).tolist()
+                    if centroids is not None else [-1] * len(rows)
+                )
+                for row, list_id in zip(rows.tolist(), assigned):
+                    record = self._record(row)
+                    record["list"] = list_id
+                    data = (json.dumps(record) + "\n").encode("utf-8")
+                    log_file.write(data)
+                    log_bytes += len(data)
+
+        self._write_manifest({
+            **manifest,
+            "generation": generation,
+            "rows": len(alive),
+            "log_bytes": log_bytes,
+            "deleted": 0,
+            "ivf_trained_rows": len(alive) if train else manifest.get("ivf_trained_rows", 0),
+        })
+        # Processes still mapping the old files keep them until they refresh
+        for kind in ("vectors", "log", "centroids"):
+            try:
+                os.remove(self._file(kind, manifest["generation"]))
+            except FileNotFoundError:
+                pass
+        self._refresh()
+        logger.info("Compacted vector index %s to generation %d: %d rows", self.path, generation, len(alive))
+
+    async def ping(self):
+        # The manifest only exists once init has run against a reachable directory
+        await asyncio.to_thread(os.stat, self._manifest_path)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.name,
+                "path": self.path,
+                "dtype": self.dtype,
+                "dimension": self.dimension,
+                "generation": self.generation,
+                "rows": len(self._ids),
+                "live": int(self._alive.sum()),
+                "ivf_lists": len(self._centroids) if self._centroids is not None else 0,
+                "searches": self.searches,
+            }
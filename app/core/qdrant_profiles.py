@@ -0,0 +1,128 @@
+from typing import Dict, List, NamedTuple, Optional, Union
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    BinaryQuantization, BinaryQuantizationConfig, CollectionInfo, Disabled, Distance, HnswConfigDiff,
+    QuantizationSearchParams, ScalarQuantization, ScalarQuantizationConfig, ScalarType, SearchParams,
+    VectorParams, VectorParamsDiff,
+)
+
+from app.core.config import Settings
+
+settings = Settings()
+
+
+class CollectionProfile(NamedTuple):
+    """How a collection stores and indexes its vectors"""
+    quantization: str = "none"  # "none", "scalar" (int8, 4x smaller) or "binary" (1 bit, 32x smaller)
+    on_disk: bool = False  # originals on disk; with quantization only the compressed copy stays in RAM
+    hnsw_m: Optional[int] = None
+    hnsw_ef_construct: Optional[int] = None
+    quantization_always_ram: bool = True
+
+    def vectors_config(self, size: int) -> VectorParams:
+        return VectorParams(size=size, distance=Distance.COSINE, on_disk=self.on_disk)
+
+    def hnsw_config(self) -> Optional[HnswConfigDiff]:
+        if self.hnsw_m is None and self.hnsw_ef_construct is None:
+            return None
+        return HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct)
+
+    def quantization_config(self) -> Optional[Union[ScalarQuantization, BinaryQuantization]]:
+        if self.quantization == "scalar":
+            return ScalarQuantization(scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8, quantile=0.99, always_ram=self.quantization_always_ram
+            ))
+        if self.quantization == "binary":
+            return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=self.quantization_always_ram))
+        if self.quantization == "none":
+            return None
+        raise ValueError(f"Unknown quantization mode: {self.quantization}")
+
+    def differences(self, info: CollectionInfo) -> List[str]:
+        """Settings where an existing collection does not match this profile"""
+        config = info.config
+        changed = []
+        vectors = config.params.vectors
+        if isinstance(vectors, VectorParams) and bool(vectors.on_disk) != self.on_disk:
+            changed.append("on_disk")
+        if self.hnsw_m is not None and config.hnsw_config.m != self.hnsw_m:
+            changed.append("hnsw_m")
+        if self.hnsw_ef_construct is not None and config.hnsw_config.ef_construct != self.hnsw_ef_construct:
+            changed.append("hnsw_ef_construct")
+        if _quantization_mode(config.quantization_config) != self.quantization:
+            changed.append("quantization")
+        return changed
+
+
+class SearchProfile(NamedTuple):
+    """Per-query accuracy/speed trade-offs"""
+    hnsw_ef: Optional[int] = None  # candidates explored per query, higher is slower and more accurate
+    rescore: bool = True  # re-rank quantized candidates with the original vectors
+    oversampling: Optional[float] = None  # fetch limit * oversampling quantized candidates before rescoring
+
+    def params(self) -> Optional[SearchParams]:
+        if self.hnsw_ef is None and self.oversampling is None and self.rescore:
+            return None
+        return SearchParams(
+            hnsw_ef=self.hnsw_ef,
+            quantization=QuantizationSearchParams(rescore=self.rescore, oversampling=self.oversampling),
+        )
+
+
+def _quantization_mode(config) -> str:
+    if isinstance(config, ScalarQuantization):
+        return "scalar"
+    if isinstance(config, BinaryQuantization):
+        return "binary"
+    return "none"
+
+
+def collection_profile() -> CollectionProfile:
+    return CollectionProfile(
+        quantization=settings.qdrant_quantization,
+        on_disk=settings.qdrant_on_disk,
+        hnsw_m=settings.qdrant_hnsw_m,
+        hnsw_ef_construct=settings.qdrant_hnsw_ef_construct,
+        quantization_always_ram=settings.qdrant_quantization_always_ram,
+    )
+
+
+def search_profile() -> SearchProfile:
+    return SearchProfile(
+        hnsw_ef=settings.qdrant_search_hnsw_ef,
+        rescore=settings.qdrant_search_rescore,
+        oversampling=settings.qdrant_search_oversampling,
+    )
+
+
+def create_collection(client: QdrantClient, collection_name: str, size: int, profile: CollectionProfile, **kwargs):
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=profile.vectors_config(size),
+        hnsw_config=profile.hnsw_config(),
+        quantization_config=profile.quantization_config(),
+        **kwargs
+    )
+
+
+def apply_profile(client: QdrantClient, collection_name: str, profile: CollectionProfile) -> List[str]:
+    """Bring an existing collection in line with ``profile``; returns what changed.
+
+    Qdrant rebuilds the affected segments in the background, the collection stays
+    searchable meanwhile.
+    """
+    changed = profile.differences(client.get_collection(collection_name))
+    if not changed:
+        return changed
+
+    kwargs: Dict[str, object] = {}
+    if "on_disk" in changed:
+        # "" addresses the collection's single unnamed vector
+        kwargs["vectors_config"] = {"": VectorParamsDiff(on_disk=profile.on_disk)}
+    if "hnsw_m" in changed or "hnsw_ef_construct" in changed:
+        kwargs["hnsw_config"] = profile.hnsw_config()
+    if "quantization" in changed:
+        kwargs["quantization_config"] = profile.quantization_config() or Disabled.DISABLED
+    client.update_collection(collection_name=collection_name, **kwargs)
+    return changed
@@ -0,0 +1,181 @@
+import contextvars
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+logger = logging.getLogger(__name__)
+
+# Request-path latencies, 1 ms to 2 minutes
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Ingestion stages run over whole documents, 10 ms to 30 minutes
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+EMBEDDING_SECONDS = Histogram(
+    "rag_embedding_seconds", "Time to encode one batch of texts", ["kind"], buckets=LATENCY_BUCKETS
+)
+EMBEDDING_TEXTS = Counter("rag_embedding_texts_total", "Texts encoded", ["kind"])
+VECTOR_SEARCH_SECONDS = Histogram(
+    "rag_vector_search_seconds", "Vector store search latency", ["backend"], buckets=LATENCY_BUCKETS
+)
+REDIS_HISTORY_SECONDS = Histogram(
+    "rag_redis_history_seconds", "Conversation memory round trips to Redis", ["operation"], buckets=LATENCY_BUCKETS
+)
+DB_COMMIT_SECONDS = Histogram("rag_db_commit_seconds", "PostgreSQL commit latency", buckets=LATENCY_BUCKETS)
+LLM_QUEUE_SECONDS = Histogram("rag_llm_queue_seconds", "Time spent waiting for an LLM slot", buckets=LATENCY_BUCKETS)
+LLM_TTFT_SECONDS = Histogram(
+    "rag_llm_time_to_first_token_seconds", "Time from sending a streamed generation to its first token",
+    buckets=LATENCY_BUCKETS,
+)
+LLM_GENERATION_SECONDS = Histogram(
+    "rag_llm_generation_seconds", "Total Ollama generation time", ["mode"], buckets=LATENCY_BUCKETS
+)
+LLM_ERRORS = Counter("rag_llm_errors_total", "Generations that were rejected or failed", ["reason"])
+INGESTION_STAGE_SECONDS = Histogram(
+    "rag_ingestion_stage_seconds", "Time per document ingestion stage", ["stage"], buckets=STAGE_BUCKETS
+)
+INGESTION_JOBS = Counter("rag_ingestion_jobs_total", "Finished ingestion jobs", ["status"])
+
+
+class Span(NamedTuple):
+    name: str
+    start: float  # seconds since the request started
+    duration: float
+
+
+class Trace:
+    """Timed spans recorded while serving one request"""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans: List[Span] = []
+
+    def add(self, name: str, started: float, duration: float):
+        self.spans.append(Span(name, round(started - self.started, 4), round(duration, 4)))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "duration": round(time.perf_counter() - self.started, 4),
+            "spans": [span._asdict() for span in self.spans],
+        }
+
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def observe(name: str, seconds: float, histogram: Optional[Histogram] = None, **labels: str):
+    """Record an already measured duration in ``histogram`` and as a span of the current trace"""
+    if histogram is not None:
+        (histogram.labels(**labels) if labels else histogram).observe(seconds)
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(name, time.perf_counter() - seconds, seconds)
+
+
+@contextmanager
+def timed(name: str, histogram: Optional[Histogram] = None, **labels: str):
+    """Time the block into ``histogram`` and the current trace, also when it raises"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, histogram, **labels)
+
+
+def metrics_response() -> tuple:
+    """Exposition body and content type for the /metrics endpoint"""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class RequestContextMiddleware:
+    """Tags every HTTP request with an ID for logs and the ``X-Request-ID`` response header.
+
+    A client-supplied ``X-Request-ID`` is kept. With ``trace`` enabled the request's spans
+    are logged once the response has been sent, so streamed responses are covered in full.
+    """
+
+    header = b"x-request-id"
+
+    def __init__(self, app, trace: bool = False):
+        self.app = app
+        self.trace = trace
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        supplied = dict(scope["headers"]).get(self.header, b"").decode("latin-1")[:64]
+        request_id = supplied or uuid.uuid4().hex
+        trace = Trace(request_id) if self.trace else None
+        request_token = _request_id.set(request_id)
+        trace_token = _trace.set(trace)
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (self.header, request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            if trace is not None:
+                logger.info(
+                    "%s %s %d in %.1f ms",
+                    scope["method"], scope["path"], status, (time.perf_counter() - trace.started) * 1000,
+                    extra={"fields": {"trace": trace.as_dict()}},
+                )
+            _trace.reset(trace_token)
+            _request_id.reset(request_token)
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get() or "-"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; structured values passed as ``extra={"fields": {...}}`` are merged in"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = "INFO", log_format: str = "text"):
+    """Send the app's loggers to stderr at ``level``, as plain text or JSON lines"""
+    handler = logging.StreamHandler()
+    handler.addFilter(RequestIdFilter())
+    if log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    app_logger = logging.getLogger("app")
+    app_logger.handlers = [handler]
+    app_logger.setLevel(level.upper())
+    app_logger.propagate = False
@@ -0,0 +1,150 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+
+import httpx
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.models import Filter, QueryRequest, ScoredPoint
+
+from app.core.config import Settings
+from app.core.database import qdrant_client
+from app.core.qdrant_profiles import SearchProfile, search_profile
+
+settings = Settings()
+
+
+class VectorSearchClient:
+    """App-lifetime async Qdrant client for the query path.
+
+    Searches never block the event loop. With ``prefer_grpc`` vectors travel as protobuf
+    over one multiplexed HTTP/2 channel instead of JSON over pooled REST connections.
+    With ``local_client`` (Qdrant local mode) queries go to that in-process client from
+    worker threads, so reads see the points the write path stored there.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int = 6333,
+        grpc_port: int = 6334,
+        prefer_grpc: bool = False,
+        timeout: int = 10,
+        max_connections: int = 20,
+        collection_name: str = "documents",
+        search_profile: Optional[SearchProfile] = None,
+        local_client: Optional[QdrantClient] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.grpc_port = grpc_port
+        self.prefer_grpc = prefer_grpc
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.collection_name = collection_name
+        self.search_params = (search_profile or SearchProfile()).params()
+        self.local_client = local_client
+        self._client: Optional[AsyncQdrantClient] = None
+        self.searches = 0
+        self.batches = 0
+
+    @property
+    def client(self) -> AsyncQdrantClient:
+        if self._client is None:
+            self._client = AsyncQdrantClient(
+                host=self.host,
+                port=self.port,
+                grpc_port=self.grpc_port,
+                prefer_grpc=self.prefer_grpc,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                check_compatibility=False,
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    async def search(
+        self,
+        vector: List[float],
+        top_k: int = 3,
+        query_filter: Optional[Filter] = None,
+    ) -> List[ScoredPoint]:
+        self.searches += 1
+        query_points = (
+            self.client.query_points if self.local_client is None
+            else self._local(self.local_client.query_points)
+        )
+        response = await query_points(
+            collection_name=self.collection_name,
+            query=vector,
+            query_filter=query_filter,
+            limit=top_k,
+            search_params=self.search_params,
+            with_payload=True,
+        )
+        return response.points
+
+    async def search_batch(
+        self,
+        vectors: List[List[float]],
+        top_k: int = 3,
+        query_filter: Optional[Filter] = None,
+    ) -> List[List[ScoredPoint]]:
+        """Resolve several query vectors in one round trip, results in input order"""
+        if not vectors:
+            return []
+        self.batches += 1
+        self.searches += len(vectors)
+        query_batch_points = (
+            self.client.query_batch_points if self.local_client is None
+            else self._local(self.local_client.query_batch_points)
+        )
+        responses = await query_batch_points(
+            collection_name=self.collection_name,
+            requests=[
+                QueryRequest(
+                    query=vector, filter=query_filter, params=self.search_params, limit=top_k, with_payload=True
+                )
+                for vector in vectors
+            ],
+        )
+        return [response.points for response in responses]
+
+    @staticmethod
+    def _local(method):
+        async def call(**kwargs):
+            return await asyncio.to_thread(method, **kwargs)
+        return call
+
+    def stats(self) -> Dict[str, Any]:
+        if self.local_client is not None:
+            transport = "local"
+        else:
+            transport = "grpc" if self.prefer_grpc else "rest"
+        return {
+            "transport": transport,
+            "searches": self.searches,
+            "batches": self.batches,
+        }
+
+
+vector_search = VectorSearchClient(
+    host=settings.qdrant_host,
+    port=settings.qdrant_port,
+    grpc_port=settings.qdrant_grpc_port,
+    prefer_grpc=settings.qdrant_prefer_grpc,
+    timeout=settings.qdrant_timeout,
+    max_connections=settings.qdrant_max_connections,
+    collection_name=settings.QDRANT_COLLECTION,
+    search_profile=search_profile(),
+    local_client=qdrant_client if settings.qdrant_local_path else None,
+)
+
+
+def get_vector_search() -> VectorSearchClient:
+    return vector_search
@@ -0,0 +1,177 @@
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    FieldCondition, Filter, FilterSelector, MatchAny, MatchValue, PointStruct, ScoredPoint
+)
+
+from app.core.config import Settings
+from app.core.database import init_qdrant, qdrant_client
+from app.core.vector_search import VectorSearchClient, vector_search
+
+settings = Settings()
+
+Vector = Union[Sequence[float], np.ndarray]
+
+
+class VectorPoint(NamedTuple):
+    id: str
+    vector: Vector
+    payload: Dict[str, Any]
+
+
+class VectorStore(ABC):
+    """Where chunk vectors live and how they are searched.
+
+    Hits come back as Qdrant ``ScoredPoint``s whatever the backend, so retrieval and
+    prompt assembly never need to know which one is configured. ``doc_id`` in the
+    payload is what ``document_ids`` filters and ``delete_document`` match on.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    async def init(self, dimension: int):
+        """Create or open the index for vectors of ``dimension``"""
+
+    @abstractmethod
+    async def search(
+        self,
+        vector: Vector,
+        top_k: int = 3,
+        document_ids: Optional[List[int]] = None,
+    ) -> List[ScoredPoint]:
+        ...
+
+    async def search_batch(
+        self,
+        vectors: List[Vector],
+        top_k: int = 3,
+        document_ids: Optional[List[int]] = None,
+    ) -> List[List[ScoredPoint]]:
+        """Results in input order; backends override this when they can do better than a loop"""
+        return [await self.search(vector, top_k, document_ids) for vector in vectors]
+
+    @abstractmethod
+    async def upsert(self, points: List[VectorPoint], on_batch: Optional[Callable[[int], None]] = None):
+        ...
+
+    @abstractmethod
+    async def delete_document(self, document_id: int):
+        ...
+
+    async def close(self):
+        pass
+
+    @abstractmethod
+    async def ping(self):
+        """Raise if the index cannot be reached, for readiness checks"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class QdrantVectorStore(VectorStore):
+    """Remote Qdrant: async client for queries, the sync client in worker threads for writes"""
+
+    name = "qdrant"
+
+    def __init__(self, client: QdrantClient, search_client: VectorSearchClient, collection_name: str = "documents"):
+        self.client = client
+        self.search_client = search_client
+        self.collection_name = collection_name
+
+    async def init(self, dimension: int):
+        await asyncio.to_thread(init_qdrant, dimension)
+
+    @staticmethod
+    def _filter(document_ids: Optional[List[int]]) -> Optional[Filter]:
+        # Served by the doc_id payload index created in init_qdrant
+        if not document_ids:
+            return None
+        return Filter(must=[FieldCondition(key="doc_id", match=MatchAny(any=list(document_ids)))])
+
+    async def search(self, vector, top_k=3, document_ids=None):
+        return await self.search_client.search(_as_list(vector), top_k, self._filter(document_ids))
+
+    async def search_batch(self, vectors, top_k=3, document_ids=None):
+        return await self.search_client.search_batch([_as_list(v) for v in vectors], top_k, self._filter(document_ids))
+
+    async def upsert(self, points, on_batch=None):
+        await asyncio.to_thread(self._upsert_points, points, on_batch)
+
+    def _upsert_points(self, points: List[VectorPoint], on_batch: Optional[Callable[[int], None]] = None):
+        """Upsert points in batches, optionally several batches at once"""
+        batch_size = settings.qdrant_upsert_batch_size
+        batches = [points[i:i + batch_size] for i in range(0, len(points), batch_size)]
+        lock = threading.Lock()
+
+        def upsert_batch(batch: List[VectorPoint]):
+            self.client.upsert(
+                collection_name=self.collection_name,
+                points=[PointStruct(id=point.id, vector=_as_list(point.vector), payload=point.payload) for point in batch],
+                wait=settings.qdrant_upsert_wait
+            )
+            if on_batch:
+                with lock:
+                    on_batch(len(batch))
+
+        if settings.qdrant_upsert_parallel > 1 and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=settings.qdrant_upsert_parallel) as executor:
+                # list() re-raises the first failed batch
+                list(executor.map(upsert_batch, batches))
+        else:
+            for batch in batches:
+                upsert_batch(batch)
+
+    async def delete_document(self, document_id: int):
+        """Remove a document's points by payload filter, one request however many there are"""
+        await asyncio.to_thread(
+            self.client.delete,
+            collection_name=self.collection_name,
+            points_selector=FilterSelector(filter=Filter(
+                must=[FieldCondition(key="doc_id", match=MatchValue(value=document_id))]
+            )),
+            wait=True
+        )
+
+    async def close(self):
+        await self.search_client.close()
+
+    async def ping(self):
+        await asyncio.to_thread(self.client.get_collection, self.collection_name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, **self.search_client.stats()}
+
+
+def _as_list(vector: Vector) -> List[float]:
+    return vector.tolist() if isinstance(vector, np.ndarray) else list(vector)
+
+
+def create_vector_store(backend: str) -> VectorStore:
+    if backend == "qdrant":
+        return QdrantVectorStore(qdrant_client, vector_search, settings.QDRANT_COLLECTION)
+    if backend == "mmap":
+        from app.core.mmap_index import MmapVectorStore
+        return MmapVectorStore(
+            settings.vector_store_dir,
+            dtype=settings.vector_store_dtype,
+            ivf_min_points=settings.vector_store_ivf_min_points,
+            ivf_lists=settings.vector_store_ivf_lists,
+            ivf_probe=settings.vector_store_ivf_probe,
+            compact_ratio=settings.vector_store_compact_ratio,
+        )
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+
+vector_store = create_vector_store(settings.vector_store_backend)
+
+
+def get_vector_store() -> VectorStore:
+    return vector_store
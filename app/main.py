@@ -1,21 +1,103 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+
+import redis
+from fastapi import FastAPI, Response
 from app.api.routes import document_router, chat_router
 from app.api.booking import booking_router
-from app.core.init_db import init_db
+from app.api.health import health_router, mark_startup_failed
+from app.core.init_db import init_tables, init_vector_index
+from app.core.database import engine
+from app.core.embeddings import embedding_registry
+from app.core.batch_embedder import query_embedder
+from app.core.llm import llm_client
+from app.core.memory import conversation_memory
+from app.core.vector_store import vector_store
+from app.core.config import Settings
+from app.core.telemetry import RequestContextMiddleware, configure_logging, metrics_response
+from app.services.extraction import shutdown_pools
+from app.services.ingestion_jobs import ingestion_queue
+
+settings = Settings()
+configure_logging(settings.log_level, settings.log_format)
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="RAG API",
     description="REST API for document ingestion, conversational RAG, and interview bookings",
     version="1.0.0")
+app.add_middleware(RequestContextMiddleware, trace=settings.trace_enabled)
+
+# Keeps the background initialisation referenced until it finishes
+_warmup_task = None
+
+
+async def _init_model_and_index():
+    """Size the vector index (loading the model on a cold metadata cache), then warm the model up"""
+    await init_vector_index()
+    # Ingestion writes to the vector index, so it only starts once the index exists
+    await ingestion_queue.start()
+    await asyncio.to_thread(embedding_registry.warmup)
+
+
+async def _init_in_background():
+    delay = settings.startup_retry_delay
+    for attempt in range(1, settings.startup_init_attempts + 1):
+        try:
+            await _init_model_and_index()
+            return
+        except Exception as e:
+            if attempt == settings.startup_init_attempts:
+                logger.exception("Vector index initialisation or embedding model warmup failed %d times, giving up", attempt)
+                # /readyz alone would keep the instance out of traffic forever; fail liveness to get it restarted
+                mark_startup_failed(str(e))
+                return
+            logger.warning(
+                "Vector index initialisation or embedding model warmup failed (attempt %d of %d), retrying in %.0f s: %s",
+                attempt, settings.startup_init_attempts, delay, e,
+            )
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database tables on startup"""
-    init_db()
+    """Initialize database tables and warm up the embedding model on startup"""
+    global _warmup_task
+    try:
+        conversation_memory.load_scripts()
+    except redis.RedisError as e:
+        # Loaded on first use instead, when Redis answers NOSCRIPT
+        logger.warning("Could not load Redis scripts: %s", e)
+    await query_embedder.start()
+    if settings.embedding_warmup_background:
+        # /healthz answers once the tables are checked, /readyz once the index and model are ready
+        await init_tables()
+        _warmup_task = asyncio.create_task(_init_in_background())
+    else:
+        await asyncio.gather(init_tables(), _init_model_and_index())
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    if _warmup_task is not None:
+        _warmup_task.cancel()
+    await ingestion_queue.stop()
+    shutdown_pools()
+    await query_embedder.stop()
+    await llm_client.close()
+    await vector_store.close()
+    await engine.dispose()
+
+app.include_router(health_router, tags=["health"])
 app.include_router(document_router, prefix="/api/documents", tags=["documents"])
 app.include_router(chat_router, prefix="/api/chat", tags=["chat"])
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to RAG API"}
+
+if settings.metrics_enabled:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        body, content_type = metrics_response()
+        return Response(body, media_type=content_type)
@@ -1,6 +1,9 @@
-from sqlalchemy import Column, String, Integer, DateTime, Text, JSON
+from sqlalchemy import Column, ForeignKey, String, Integer, DateTime, Text, JSON, Index, LargeBinary, func, literal_column
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
+from app.core.config import Settings
+
+settings = Settings()
 
 Base = declarative_base()
 
@@ -21,9 +24,27 @@ class TextChunk(Base):
     __tablename__ = "text_chunks"
     
     id = Column(Integer, primary_key=True)
-    document_id = Column(Integer)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), index=True)
     chunk_index = Column(Integer)
     content = Column(Text)
     vector_id = Column(String)  # ID in Qdrant
     created_at = Column(DateTime, default=datetime.utcnow)
     chunk_metadata = Column(JSON)
+
+    __table_args__ = (
+        # Lexical index for hybrid retrieval; queries must use the same expression to hit it.
+        # The config is inlined because a bound REGCONFIG value can't be rendered in DDL
+        Index(
+            "ix_text_chunks_content_tsv",
+            func.to_tsvector(literal_column(f"'{settings.text_search_config}'::regconfig"), content),
+            postgresql_using="gin",
+        ),
+    )
+
+class ChunkEmbedding(Base):
+    __tablename__ = "chunk_embeddings"
+
+    content_hash = Column(String, primary_key=True)  # sha256 of model name + normalized chunk text
+    model_name = Column(String, nullable=False)
+    embedding = Column(LargeBinary, nullable=False)  # float32 bytes
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -1,9 +1,23 @@
-from pydantic import BaseModel
+from enum import Enum
+from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
 
+class RetrievalMode(str, Enum):
+    DENSE = "dense"
+    HYBRID = "hybrid"
+
+class RetrievalOptions(BaseModel):
+    """Per-request overrides; unset fields fall back to the configured defaults"""
+    mode: Optional[RetrievalMode] = None
+    top_k: Optional[int] = Field(default=None, ge=1, le=50)
+    dense_weight: Optional[float] = Field(default=None, ge=0)
+    sparse_weight: Optional[float] = Field(default=None, ge=0)
+    document_ids: Optional[List[int]] = Field(default=None, min_length=1)  # search only these documents
+
 class ChatRequest(BaseModel):
     query: str
     conversation_id: Optional[str] = None
+    retrieval: Optional[RetrievalOptions] = None
 
 class Source(BaseModel):
     content: str
@@ -14,3 +28,4 @@ class ChatResponse(BaseModel):
     answer: str
     sources: List[Source]
     conversation_id: str
+    usage: Optional[Dict[str, Any]] = None
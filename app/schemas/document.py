@@ -1,11 +1,38 @@
 from enum import Enum
+from typing import Dict, Optional
 from pydantic import BaseModel
 
 class ChunkingStrategy(str, Enum):
     RECURSIVE = "recursive"
     SENTENCE = "sentence"
+    TOKEN = "token"
 
 class DocumentResponse(BaseModel):
     document_id: str
     filename: str
     chunking_strategy: ChunkingStrategy
+    timings: Optional[Dict[str, float]] = None  # seconds per ingestion stage
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class IngestionJobResponse(BaseModel):
+    job_id: str
+    filename: str
+    chunking_strategy: ChunkingStrategy
+    status: JobStatus
+
+class IngestionJobStatusResponse(BaseModel):
+    job_id: str
+    filename: str
+    status: JobStatus
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    chunks_indexed: int = 0
+    document_id: Optional[str] = None
+    timings: Optional[Dict[str, float]] = None
+    error: Optional[str] = None
@@ -1,17 +1,18 @@
 from typing import List
 from fastapi import Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.booking import Booking
 from app.schemas.booking import BookingCreate
 from app.core.database import get_db
 
 class BookingService:
-    def __init__(self, db: Session = Depends(get_db)):
+    def __init__(self, db: AsyncSession = Depends(get_db)):
         self.db = db
         
     ### Create a new booking
-    def create_booking(self, booking: BookingCreate) -> Booking:
+    async def create_booking(self, booking: BookingCreate) -> Booking:
         db_booking = Booking(
             name=booking.name,
             email=booking.email,
@@ -20,11 +21,12 @@ class BookingService:
         )
         
         self.db.add(db_booking)
-        self.db.commit()
-        self.db.refresh(db_booking)
+        await self.db.commit()
+        await self.db.refresh(db_booking)
         
         return db_booking
     
     ### Get all bookings
-    def get_bookings(self) -> List[Booking]:
-        return self.db.query(Booking).all()
+    async def get_bookings(self) -> List[Booking]:
+        result = await self.db.scalars(select(Booking))
+        return list(result.all())
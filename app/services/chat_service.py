@@ -1,78 +1,336 @@
-from datetime import datetime
+import asyncio
+import logging
+from contextlib import aclosing
 
-from typing import Dict, List, Optional, Any
+from typing import AsyncIterator, Dict, List, Optional, Any, Tuple
 from fastapi import Depends
 import redis
-from sentence_transformers import SentenceTransformer
-from qdrant_client import QdrantClient
 import httpx
 import json
-from sqlalchemy.orm import Session
-from app.schemas.booking import BookingCreate
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.schemas.chat import RetrievalOptions
 
-from app.core.database import get_booking_service, get_redis, get_qdrant
+from app.core.database import get_redis
 from app.core.config import Settings
-from app.core.database import get_db
+from app.core.database import SessionLocal, get_db
+from app.core.llm import LLMOverloadedError, OllamaClient, get_llm_client
+from app.core.batch_embedder import BatchingEmbedder, get_query_embedder
+from app.core.memory import ConversationMemory, ConversationState, get_conversation_memory
+from app.core.cache import (
+    AnswerCache, QueryEmbeddingCache, depends_on_history, get_answer_cache, get_query_embedding_cache
+)
 from fastapi import Depends
 from app.models.booking import Booking
+from app.services.prompt_budget import PromptBudgeter, get_prompt_budgeter
+from app.services.retrieval import Retriever
+from app.core.telemetry import timed
 
 
 
 settings = Settings()
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = (
+    "You are a helpful assistant with access to a document database. "
+    "Use the provided context to answer questions accurately and cite your sources. "
+    "If you're unsure or the context doesn't contain the information, say so. "
+    "Maintain conversation context for follow-up questions."
+)
+
+
+# Keeps background summaries referenced until they finish
+_background_tasks = set()
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 
 class ChatService:
     def __init__(
         self,
         redis_client: redis.Redis = Depends(get_redis),
-        qdrant: QdrantClient = Depends(get_qdrant),
-        db: Session = Depends(get_db),
+        retriever: Retriever = Depends(),
+        db: AsyncSession = Depends(get_db),
+        query_embedder: BatchingEmbedder = Depends(get_query_embedder),
+        embedding_cache: QueryEmbeddingCache = Depends(get_query_embedding_cache),
+        answer_cache: Optional[AnswerCache] = Depends(get_answer_cache),
+        llm: OllamaClient = Depends(get_llm_client),
+        prompt_budgeter: PromptBudgeter = Depends(get_prompt_budgeter),
+        memory: ConversationMemory = Depends(get_conversation_memory),
     ):
         self.redis = redis_client
-        self.qdrant = qdrant
-        self.embedding_model = SentenceTransformer(settings.embedding_model)
-        self.ollama_url = f"{settings.ollama_host}/api/generate"
+        self.retriever = retriever
+        self.query_embedder = query_embedder
+        self.embedding_cache = embedding_cache
+        self.answer_cache = answer_cache
+        self.llm = llm
+        self.prompt_budgeter = prompt_budgeter
+        self.memory = memory
         self.db = db
 
-    def _get_relevant_chunks(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
-        query_vector = self.embedding_model.encode([query])[0].tolist()
-        
-        results = self.qdrant.search(
-            collection_name=settings.QDRANT_COLLECTION,
-            query_vector=query_vector,
-            limit=top_k
-        )
-        
-        return results
+    async def _embed_query(self, query: str) -> List[float]:
+        query_vector = self.embedding_cache.get(query)
+        if query_vector is None:
+            # Includes the wait for the batching worker, the encode itself is in rag_embedding_seconds
+            with timed("embed_query"):
+                query_vector = await self.query_embedder.embed(query)
+            self.embedding_cache.set(query, query_vector)
+        return query_vector
+
+    async def _get_relevant_chunks(
+        self,
+        query: str,
+        query_vector: List[float],
+        retrieval: Optional[RetrievalOptions] = None,
+    ) -> List[Any]:
+        return await self.retriever.retrieve(query, query_vector, retrieval)
 
     async def get_response(
         self,
         query: str,
         conversation_id: str,
         max_history: int = 5,
+        retrieval: Optional[RetrievalOptions] = None,
     ) -> Dict[str, Any]:
         
-        self._store_chat_message(conversation_id, "user", query)
+        state = self._load_conversation(conversation_id, query, max_history)
+
+        # Check if booking flow should be triggered
+        if self._is_booking_request(query, state.booking):
+            return await self._handle_booking_flow(conversation_id, query, state.booking)
+
+        # The last message is the query that was just stored
+        history = state.history[:-1]
+        logger.debug(
+            "Answering conversation %s with %d history messages", conversation_id, len(history),
+            extra={"fields": {"conversation_id": conversation_id, "history_messages": len(history)}},
+        )
 
+        cache_version = self._answer_cache_version(query, history)
+        query_vector = await self._embed_query(query)
+        relevant_chunks = await self._get_relevant_chunks(query, query_vector, retrieval)
+        chunk_ids = [str(chunk.id) for chunk in relevant_chunks]
+
+        if cache_version is not None:
+            cached = self.answer_cache.get(query_vector, chunk_ids, cache_version)
+            if cached is not None:
+                self._store_answer(conversation_id, cached["answer"])
+                # The cached turn is not in Ollama's context, so rebuild it from history next time
+                self.memory.clear_llm_context(conversation_id)
+                return cached
+
+        payload, usage = self._generation_payload(query, state, history, relevant_chunks)
+        logger.debug("Prompt usage %s", usage, extra={"fields": {"usage": usage}})
+
+        try:
+            data = await self.llm.generate(payload)
+        except httpx.HTTPError as e:
+            logger.warning("Ollama API error: %s", e)
+            return {"answer": "Error generating response", "sources": []}
+
+        answer = data.get("response", "")
+        logger.debug("Generated %d characters", len(answer), extra={"fields": {"answer_chars": len(answer)}})
+
+        self._store_answer(conversation_id, answer, data.get("context"))
+
+        result = {
+            "answer": answer,
+            "sources": self._format_sources(relevant_chunks)
+        }
+        if cache_version is not None:
+            self.answer_cache.set(query_vector, chunk_ids, result, cache_version)
+
+        result["usage"] = {
+            **usage,
+            "prompt_eval_count": data.get("prompt_eval_count"),
+            "eval_count": data.get("eval_count"),
+        }
+        return result
+
+    async def stream_response(
+        self,
+        query: str,
+        conversation_id: str,
+        max_history: int = 5,
+        retrieval: Optional[RetrievalOptions] = None,
+    ) -> AsyncIterator[str]:
+        """Yield the answer as Server-Sent Events: sources first, then one event per token"""
+        # FastAPI closes the request's session before a streamed body runs, so the stream
+        # (lexical search, booking commit) uses a session of its own
+        async with SessionLocal() as db:
+            self.db = self.retriever.db = db
+            async with aclosing(self._stream_events(query, conversation_id, max_history, retrieval)) as events:
+                async for event in events:
+                    yield event
+
+    async def _stream_events(
+        self,
+        query: str,
+        conversation_id: str,
+        max_history: int,
+        retrieval: Optional[RetrievalOptions],
+    ) -> AsyncIterator[str]:
+        state = self._load_conversation(conversation_id, query, max_history)
+
+        if self._is_booking_request(query, state.booking):
+            result = await self._handle_booking_flow(conversation_id, query, state.booking)
+            yield _sse("sources", [])
+            yield _sse("token", {"token": result["answer"]})
+            yield _sse("done", {"conversation_id": conversation_id})
+            return
+
+        history = state.history[:-1]
+
+        cache_version = self._answer_cache_version(query, history)
+        query_vector = await self._embed_query(query)
+        relevant_chunks = await self._get_relevant_chunks(query, query_vector, retrieval)
+        chunk_ids = [str(chunk.id) for chunk in relevant_chunks]
+        sources = self._format_sources(relevant_chunks)
+
+        yield _sse("sources", sources)
+
+        if cache_version is not None:
+            cached = self.answer_cache.get(query_vector, chunk_ids, cache_version)
+            if cached is not None:
+                self._store_answer(conversation_id, cached["answer"])
+                # The cached turn is not in Ollama's context, so rebuild it from history next time
+                self.memory.clear_llm_context(conversation_id)
+                yield _sse("token", {"token": cached["answer"]})
+                yield _sse("done", {"conversation_id": conversation_id})
+                return
+
+        payload, usage = self._generation_payload(query, state, history, relevant_chunks)
+
+        tokens = []
+        llm_context = None
+        completed = False
+        try:
+            async for data in self.llm.stream_generate(payload):
+                token = data.get("response", "")
+                if token:
+                    tokens.append(token)
+                    yield _sse("token", {"token": token})
+                if data.get("done"):
+                    llm_context = data.get("context")
+                    usage["prompt_eval_count"] = data.get("prompt_eval_count")
+                    usage["eval_count"] = data.get("eval_count")
+            completed = True
+            yield _sse("done", {"conversation_id": conversation_id, "usage": usage})
+        except LLMOverloadedError as e:
+            yield _sse("error", {"detail": str(e), "status_code": e.status_code})
+        except httpx.HTTPError as e:
+            logger.warning("Ollama API error: %s", e)
+            yield _sse("error", {"detail": "Error generating response"})
+        finally:
+            # Runs on normal completion and when the client disconnects mid-stream
+            if tokens:
+                answer = "".join(tokens)
+                self._store_answer(conversation_id, answer, llm_context)
+                if completed and cache_version is not None:
+                    self.answer_cache.set(query_vector, chunk_ids, {"answer": answer, "sources": sources}, cache_version)
+
+    def _answer_cache_version(self, query: str, history: List[Dict[str, str]]) -> Optional[int]:
+        """Corpus version to look up and file this turn's answer under, None to bypass the cache.
+
+        Read before retrieval, so an ingestion that finishes mid-generation cannot file an
+        answer built from the old corpus under the new version.
+        """
+        if self.answer_cache is None:
+            return None
+        if depends_on_history(query, history):
+            self.answer_cache.skip()
+            return None
+        return self.answer_cache.corpus_version()
+
+    def _is_booking_request(self, query: str, booking_state: Optional[bytes]) -> bool:
         booking_keywords = ["book interview", "schedule interview", "interview booking", "book an interview", "schedule an interview", "interview appointment", "interview"]
+        return any(kw in query.lower() for kw in booking_keywords) or booking_state is not None
+
+    def _load_conversation(self, conversation_id: str, query: str, max_history: int) -> ConversationState:
+        """Store the user message and load history, summary and booking state in one round trip"""
+        return self.memory.append_and_load(
+            conversation_id,
+            "user",
+            query,
+            max_messages=max_history * 2 + 1,  # pairs of earlier messages plus this one
+            with_llm_context=settings.chat_context_mode == "context",
+        )
 
-        # Check if booking flow should be triggered
-        if any(kw in query.lower() for kw in booking_keywords) or self.redis.exists(f"booking:{conversation_id}"):            
-            return await self._handle_booking_flow(conversation_id, query)
+    def _store_answer(self, conversation_id: str, answer: str, llm_context: Optional[List[int]] = None):
+        if settings.chat_context_mode != "context":
+            llm_context = None
+        pending = self.memory.append(conversation_id, "assistant", answer, llm_context)
+        if pending >= self.memory.summary_batch:
+            task = asyncio.create_task(self.memory.summarize(conversation_id, self._summarize))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+
+    async def _summarize(self, summary: Optional[str], messages: List[Dict[str, str]]) -> str:
+        """Fold older messages into the running conversation summary"""
+        transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+        prompt = (
+            "Update the summary of this conversation with the new messages. Keep names, "
+            "facts, decisions and open questions; be brief.\n\n"
+            f"Current summary:\n{summary or 'None'}\n\nNew messages:\n{transcript}\n\nUpdated summary:"
+        )
+        data = await self.llm.generate({
+            "model": settings.ollama_model,
+            "keep_alive": settings.ollama_keep_alive,
+            "prompt": prompt,
+            "options": {"num_predict": settings.chat_summary_max_tokens},
+        })
+        return data.get("response", "").strip()
 
+    def _generation_payload(
+        self,
+        query: str,
+        state: ConversationState,
+        history: List[Dict[str, str]],
+        relevant_chunks: List[Any],
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Build the Ollama payload within the prompt token budget, plus its token usage"""
+        payload = {
+            "model": settings.ollama_model,
+            "keep_alive": settings.ollama_keep_alive,
+        }
 
-        history = self._get_chat_history(conversation_id, max_history)
-        print("Chat history:", history, 'for conversation_id:', conversation_id, 'query:', query)
+        llm_context = state.llm_context
+        if llm_context:
+            # Earlier turns are already encoded in the context tokens, send only the new turn
+            context, _, usage = self.prompt_budgeter.fit([query], relevant_chunks, [])
+            if usage["prompt_tokens"] + len(llm_context) <= self.prompt_budgeter.max_tokens:
+                usage["prompt_tokens"] += len(llm_context)
+                usage["llm_context_tokens"] = len(llm_context)
+                payload["context"] = llm_context
+                payload["prompt"] = self._build_prompt(query, [], context, include_system=False)
+                return payload, usage
+            # The carried-over context has outgrown the budget, start again from trimmed history
+
+        summary = self._summary_text(state.summary)
+        context, earlier_turns, usage = self.prompt_budgeter.fit(
+            [SYSTEM_PROMPT, summary, query], relevant_chunks, history
+        )
+        payload["prompt"] = self._build_prompt(query, earlier_turns, context, summary=summary)
+        return payload, usage
 
-        relevant_chunks = self._get_relevant_chunks(query)
+    @staticmethod
+    def _summary_text(summary: Optional[str]) -> str:
+        return f"Summary of the earlier conversation:\n{summary}" if summary else ""
 
-        messages = [
-            {"role": "system", "content": (
-                "You are a helpful assistant with access to a document database. "
-                "Use the provided context to answer questions accurately and cite your sources. "
-                "If you're unsure or the context doesn't contain the information, say so. "
-                "Maintain conversation context for follow-up questions."
-            )}
-        ]
+    def _build_prompt(
+        self,
+        query: str,
+        history: List[Dict[str, str]],
+        context: str,
+        include_system: bool = True,
+        summary: str = "",
+    ) -> str:
+        messages = []
+        if include_system:
+            messages.append({"role": "system", "content": SYSTEM_PROMPT})
+        if summary:
+            messages.append({"role": "system", "content": summary})
 
         for msg in history:
             messages.append({
@@ -80,7 +338,6 @@ class ChatService:
                 "content": msg["content"]
             })
 
-        context = "\n\n".join([chunk.payload["text"] for chunk in relevant_chunks])
         if not context.strip():
             context = "No relevant context available."
         messages.append({
@@ -88,75 +345,27 @@ class ChatService:
             "content": f"Context:\n{context}\n\nQuestion: {query}"
         })
 
-        prompt = "\n".join([msg["content"] for msg in messages])
-        print(f"Prompt length: {len(prompt)}")
-        
-        async with httpx.AsyncClient(timeout=120) as client: 
-            try:
-                response = await client.post(
-                    self.ollama_url,
-                    json={
-                        "model": settings.ollama_model,
-                        "prompt": prompt,
-                    }
-                )
-                response.raise_for_status()
-            except httpx.HTTPError as e:
-                print("Ollama API error:", e)
-                return {"answer": "Error generating response", "sources": []}
-
-        answer = ""
-        lines = response.text.strip().splitlines()
-        for line in lines:
-            try:
-                data = json.loads(line)
-                answer += data.get("response", "")
-            except json.JSONDecodeError:
-                print("Skipping malformed line from Ollama:", line)
-
-        print("Ollama response:", answer)
-
-        self._store_chat_message(conversation_id, "assistant", answer)
-
-        return {
-            "answer": answer,
-            "sources": [
-                {
-                    "content": chunk.payload["text"],
-                    "score": chunk.score,
-                    "metadata": {"doc_id": chunk.payload["doc_id"]}
-                }
-                for chunk in relevant_chunks
-            ]
-        }
-
-    
-    def _get_chat_history(self, conversation_id: str, max_history: int) -> List[Dict[str, str]]:
-        """Get chat history from Redis"""
-        history_key = f"chat:history:{conversation_id}"
-        history = self.redis.lrange(history_key, 0, max_history * 2 - 1)  # *2 for pairs of messages
-        
-        if not history:
-            return []
-            
-        return [json.loads(msg) for msg in history]
-    
-    def _store_chat_message(self, conversation_id: str, role: str, content: str):
-        """Store chat message in Redis"""
-        history_key = f"chat:history:{conversation_id}"
-        message = json.dumps({"role": role, "content": content})
-        
-        self.redis.lpush(history_key, message)
-        self.redis.expire(history_key, settings.chat_history_ttl)
-
-
+        return "\n".join([msg["content"] for msg in messages])
 
+    def _format_sources(self, relevant_chunks: List[Any]) -> List[Dict[str, Any]]:
+        return [
+            {
+                "content": chunk.payload["text"],
+                "score": chunk.score,
+                "metadata": {"doc_id": chunk.payload["doc_id"]}
+            }
+            for chunk in relevant_chunks
+        ]
 
     # TODO: ADD VALIDATION TO THE FIELDS BEFORE STORING THEM, IMPLEMENT BATCH INPUT(CURRENTLY ONLY SERIEAL INPUT)
-    async def _handle_booking_flow(self, conversation_id: str, query: str) -> Dict[str, Any]:
+    async def _handle_booking_flow(
+        self,
+        conversation_id: str,
+        query: str,
+        booking_state: Optional[bytes] = None,
+    ) -> Dict[str, Any]:
         BOOKING_FIELDS = ["name", "email", "date", "time"]
         booking_key = f"booking:{conversation_id}"
-        booking_state = self.redis.get(booking_key)
 
         if not booking_state:
             booking_state = {field: None for field in BOOKING_FIELDS}
@@ -192,7 +401,6 @@ class ChatService:
             )
 
             self.db.add(db_booking)
-            self.db.commit()
-            self.db.refresh(db_booking)
+            await self.db.commit()
 
             return {"answer": "✅ Your interview has been booked successfully!", "sources": []}
@@ -0,0 +1,454 @@
+import re
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, compress
+from operator import sub
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
+
+Span = Tuple[int, int]
+Part = Union[Span, str]
+
+
+class ChunkSpan(NamedTuple):
+    """A chunk described by offsets into the source text.
+
+    ``parts`` are source ranges, plus literal strings where a strategy inserts text
+    that is not in the source (the "\\n" before recursive overlap, sentences rejoined
+    with single spaces). ``start``/``end`` bound the source range the chunk was built from.
+    """
+    start: int
+    end: int
+    parts: Tuple[Part, ...]
+
+    def text(self, source: str) -> str:
+        if len(self.parts) == 1:
+            part = self.parts[0]
+            return source[part[0]:part[1]] if isinstance(part, tuple) else part
+        return "".join(source[part[0]:part[1]] if isinstance(part, tuple) else part for part in self.parts)
+
+
+def _make_chunk(parts: List[Part]) -> ChunkSpan:
+    spans = [part for part in parts if isinstance(part, tuple)]
+    if not spans:
+        return ChunkSpan(0, 0, tuple(parts))
+    return ChunkSpan(spans[0][0], spans[-1][1], tuple(parts))
+
+
+def _append_span(parts: List[Part], span: Span):
+    # Adjacent source ranges are merged so a contiguous chunk stays a single span
+    if span[0] == span[1]:
+        return
+    if parts and isinstance(parts[-1], tuple) and parts[-1][1] == span[0]:
+        parts[-1] = (parts[-1][0], span[1])
+    else:
+        parts.append(span)
+
+
+class RecursivePolicy:
+    """Splits on paragraph, line, sentence and word separators, then appends overlap.
+
+    Produces exactly the chunks of the original string-based recursive splitter, but
+    works on offsets: pieces are lists of source ranges and their lengths are summed
+    instead of rebuilding candidate strings.
+    """
+
+    separators = ("\n\n", "\n", ".", " ")
+
+    def __init__(self, chunk_size: int, chunk_overlap: int):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    def _split(self, text: str, segments: List[Span], separator: str) -> List[Tuple[List[Span], int, Optional[Span]]]:
+        """Split a list of source ranges on ``separator``.
+
+        Returns ``(segments, length, separator_before)`` per piece, including empty
+        pieces, like ``str.split``. Separators after the first are single characters
+        and the first one is only applied to the whole text, so an occurrence never
+        straddles two ranges.
+        """
+        pieces = []
+        current: List[Span] = []
+        length = 0
+        previous_separator = None
+        step = len(separator)
+        for start, end in segments:
+            position = start
+            while True:
+                found = text.find(separator, position, end)
+                if found == -1:
+                    break
+                if found > position:
+                    current.append((position, found))
+                    length += found - position
+                pieces.append((current, length, previous_separator))
+                previous_separator = (found, found + step)
+                current = []
+                length = 0
+                position = found + step
+            if end > position:
+                current.append((position, end))
+                length += end - position
+        pieces.append((current, length, previous_separator))
+        return pieces
+
+    @staticmethod
+    def _is_clean(text: str, segments: List[Span], separator: str) -> bool:
+        """Whether splitting on ``separator`` and rejoining the non-empty pieces gives
+        back the same text, i.e. there is no leading, trailing or doubled separator"""
+        if not segments:
+            return True
+        if text.startswith(separator, *segments[0]) or text.endswith(separator, *segments[-1]):
+            return False
+        doubled = separator * 2
+        for i, (start, end) in enumerate(segments):
+            if text.find(doubled, start, end) != -1:
+                return False
+            if i and text.endswith(separator, *segments[i - 1]) and text.startswith(separator, start, end):
+                return False
+        return True
+
+    def _split_by_separator(
+        self,
+        text: str,
+        segments: List[Span],
+        length: int,
+        separators: Sequence[str],
+    ) -> List[Tuple[List[Span], int]]:
+        # A piece that already fits comes out of a level unchanged unless the level drops
+        # empty splits, so skip those levels without walking every separator
+        while separators and length <= self.chunk_size and self._is_clean(text, segments, separators[0]):
+            separators = separators[1:]
+
+        if not separators:
+            return [(segments, length)]
+
+        if len(segments) == 1:
+            return self._split_contiguous(text, segments[0], separators)
+
+        separator = separators[0]
+        pieces = self._split(text, segments, separator)
+
+        if len(pieces) == 1:
+            return self._split_by_separator(text, segments, length, separators[1:])
+
+        results = []
+        current: List[Span] = []
+        current_length = 0
+
+        for piece, piece_length, separator_before in pieces:
+            if not piece_length:
+                continue
+
+            potential_length = current_length + len(separator) + piece_length if current else piece_length
+
+            if potential_length > self.chunk_size:
+                if current:
+                    results.extend(self._split_by_separator(text, current, current_length, separators[1:]))
+                results.extend(self._split_by_separator(text, piece, piece_length, separators[1:]))
+                current = []
+                current_length = 0
+            else:
+                if not current:
+                    current = list(piece)
+                elif current[-1][1] == separator_before[0] and separator_before[1] == piece[0][0]:
+                    # Common case: piece follows the current text directly, so just extend the span
+                    current[-1] = (current[-1][0], piece[0][1])
+                    current.extend(piece[1:])
+                else:
+                    # Any occurrence of the separator reads the same, use the one right before the piece
+                    _append_span(current, separator_before)
+                    for span in piece:
+                        _append_span(current, span)
+                current_length = potential_length
+
+        if current:
+            results.extend(self._split_by_separator(text, current, current_length, separators[1:]))
+
+        return results
+
+    def _split_contiguous(self, text: str, segment: Span, separators: Sequence[str]) -> List[Tuple[List[Span], int]]:
+        """Same as the general path for a single source range, which is by far the most
+        common input: piece lengths come from one C-level split and a merged chunk grows
+        by moving its end offset"""
+        separator = separators[0]
+        start, end = segment
+        lengths = list(map(len, text[start:end].split(separator)))
+
+        if len(lengths) == 1:
+            return self._split_by_separator(text, [segment], end - start, separators[1:])
+
+        step = len(separator)
+        results = []
+        current: List[Span] = []
+        current_length = 0
+        position = start
+
+        for piece_length in lengths:
+            if piece_length:
+                piece_end = position + piece_length
+                potential_length = current_length + step + piece_length if current else piece_length
+
+                if potential_length > self.chunk_size:
+                    if current:
+                        results.extend(self._split_by_separator(text, current, current_length, separators[1:]))
+                    results.extend(self._split_by_separator(text, [(position, piece_end)], piece_length, separators[1:]))
+                    current = []
+                    current_length = 0
+                else:
+                    if not current:
+                        current = [(position, piece_end)]
+                    elif current[-1][1] + step == position:
+                        current[-1] = (current[-1][0], piece_end)
+                    else:
+                        # Empty splits were dropped in between; keep the separator right before the piece
+                        current.append((position - step, piece_end))
+                    current_length = potential_length
+
+            position += piece_length + step
+
+        if current:
+            results.extend(self._split_by_separator(text, current, current_length, separators[1:]))
+
+        return results
+
+    def _prefix(self, segments: List[Span], limit: int) -> List[Span]:
+        prefix = []
+        for start, end in segments:
+            if limit <= 0:
+                break
+            prefix.append((start, min(end, start + limit)))
+            limit -= end - start
+        return prefix
+
+    def spans(self, text: str) -> List[ChunkSpan]:
+        raw_chunks = self._split_by_separator(text, [(0, len(text))] if text else [], len(text), self.separators)
+
+        chunks = []
+        for i, (segments, _) in enumerate(raw_chunks):
+            parts: List[Part] = list(segments)
+            if i < len(raw_chunks) - 1 and self.chunk_overlap > 0 and raw_chunks[i + 1][1] > self.chunk_overlap:
+                parts.append("\n")
+                parts.extend(self._prefix(raw_chunks[i + 1][0], self.chunk_overlap))
+            chunks.append(_make_chunk(parts))
+        return chunks
+
+
+class SentencePolicy:
+    """Packs whole sentences up to ``chunk_size`` characters, carrying up to three
+    trailing sentences (within ``chunk_overlap`` characters) into the next chunk.
+
+    Chunks are kept as ranges of sentence indices, so overlap and sizes are computed
+    with index arithmetic instead of list inserts and repeated sums.
+    """
+
+    # Same boundaries as r'(?<=[.!?])\s+', but a leading character class lets the regex
+    # engine skip ahead instead of testing a lookbehind at every position
+    sentence_boundary = re.compile(r'([.!?])(\s+)')
+
+    def __init__(self, chunk_size: int, chunk_overlap: int):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    def _sentences(self, text: str) -> Tuple[List[int], List[int], List[int], Optional[str]]:
+        """Start and end offsets of the sentences, the indices of sentences whose gap to the
+        previous sentence is not a single space, and, if there are any, the stripped text
+        with every gap replaced by one space (which is what a chunk over them reads)"""
+        stripped = text.strip()
+        # re.split yields sentence body, closing punctuation, whitespace, sentence body, ...
+        parts = self.sentence_boundary.split(stripped)
+        offsets = list(accumulate(map(len, parts), initial=len(text) - len(text.lstrip())))
+        starts = offsets[0::3]
+        ends = offsets[2::3]
+        ends.append(offsets[-1])
+        gaps = parts[2::3]
+        irregular = list(compress(range(1, len(starts)), map(" ".__ne__, gaps)))
+        joined = None
+        if irregular:
+            parts[2::3] = [" "] * len(gaps)
+            joined = "".join(parts)
+        return starts, ends, irregular, joined
+
+    def sentence_spans(self, text: str) -> Tuple[List[Span], List[int]]:
+        """Source ranges of the sentences, plus the indices of sentences whose gap to the
+        previous sentence is not a single space"""
+        starts, ends, irregular, _ = self._sentences(text)
+        return list(zip(starts, ends)), irregular
+
+    @staticmethod
+    def _chunk(
+        starts: List[int],
+        ends: List[int],
+        irregular: List[int],
+        sizes: List[int],
+        joined: Optional[str],
+        lo: int,
+        hi: int,
+    ) -> ChunkSpan:
+        start, end = starts[lo], ends[hi - 1]
+        if bisect_right(irregular, lo) == bisect_left(irregular, hi):
+            return ChunkSpan(start, end, ((start, end),) if end > start else ("",))
+        # Sentences are one space apart in ``joined``, so the chunk is a single slice of it
+        return ChunkSpan(start, end, (joined[sizes[lo] + lo:sizes[hi] + hi - 1],))
+
+    def spans(self, text: str) -> List[ChunkSpan]:
+        starts, ends, irregular, joined = self._sentences(text)
+        # sizes[i] is the total length of the first i sentences, so any range sums in O(1)
+        sizes = list(accumulate(map(sub, ends, starts), initial=0))
+        count = len(starts)
+
+        chunks = []
+        lo = hi = 0  # current chunk is sentences[lo:hi]
+
+        while hi < count:
+            # Jump to the first sentence that no longer fits after sentences[lo:...]
+            index = max(bisect_right(sizes, sizes[lo] + self.chunk_size) - 1, hi, lo + 1)
+            if index >= count:
+                hi = count
+                break
+
+            chunks.append(self._chunk(starts, ends, irregular, sizes, joined, lo, index))
+
+            # Keep up to the last 3 sentences that fit in the overlap budget
+            overlap_start = index
+            for previous in range(index - 1, max(lo, index - 3) - 1, -1):
+                if sizes[index] - sizes[previous] <= self.chunk_overlap:
+                    overlap_start = previous
+                else:
+                    break
+            lo = overlap_start
+            hi = index + 1
+
+        if hi > lo:
+            chunks.append(self._chunk(starts, ends, irregular, sizes, joined, lo, hi))
+
+        return chunks
+
+
+def _token_counts(tokenizer, texts: List[str], batch_size: int = 1024, add_special_tokens: bool = False) -> List[int]:
+    """Token counts from batched calls, which fast tokenizers run in parallel"""
+    counts = []
+    for start in range(0, len(texts), batch_size):
+        encoded = tokenizer(
+            texts[start:start + batch_size],
+            add_special_tokens=add_special_tokens,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+        )
+        counts.extend(map(len, encoded["input_ids"]))
+    return counts
+
+
+class TokenBudgetPolicy:
+    """Packs sentences up to a token budget measured with the embedding model's tokenizer.
+
+    The whole document is tokenized sentence by sentence in batches; chunk sizes are
+    the sum of their sentences' token counts. Sentences longer than the budget are cut
+    at token boundaries. Overlap carries up to three trailing sentences within
+    ``overlap_tokens``, and is dropped when it would push the next chunk over budget.
+    """
+
+    def __init__(self, tokenizer, max_tokens: int, overlap_tokens: int = 0):
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        # Room for [CLS]/[SEP] or equivalent, which the model adds when encoding
+        self.budget = max_tokens - tokenizer.num_special_tokens_to_add()
+        self._sentences = SentencePolicy(0, 0)
+
+    def _units(self, text: str) -> List[Tuple[int, int, int]]:
+        """(start, end, tokens) for each sentence, with oversized sentences cut into windows"""
+        sentences, _ = self._sentences.sentence_spans(text)
+        counts = _token_counts(self.tokenizer, [text[start:end] for start, end in sentences])
+
+        units = []
+        for (start, end), count in zip(sentences, counts):
+            if count <= self.budget:
+                units.append((start, end, count))
+                continue
+            offsets = self.tokenizer(
+                text[start:end],
+                add_special_tokens=False,
+                return_offsets_mapping=True,
+            )["offset_mapping"]
+            for window in range(0, len(offsets), self.budget):
+                window_offsets = offsets[window:window + self.budget]
+                units.append((start + window_offsets[0][0], start + window_offsets[-1][1], len(window_offsets)))
+        return units
+
+    @staticmethod
+    def _chunk(text: str, units: List[Tuple[int, int, int]], lo: int, hi: int) -> ChunkSpan:
+        parts: List[Part] = []
+        for index in range(lo, hi):
+            start, end, _ = units[index]
+            if index > lo:
+                previous_end = units[index - 1][1]
+                # Same joiner as the sentence strategy: keep single spaces from the source
+                if text[previous_end:start] in ("", " "):
+                    _append_span(parts, (previous_end, start))
+                else:
+                    parts.append(" ")
+            _append_span(parts, (start, end))
+        if not parts:
+            parts.append("")
+        return _make_chunk(parts)
+
+    def spans(self, text: str) -> List[ChunkSpan]:
+        units = self._units(text)
+        sizes = list(accumulate((tokens for _, _, tokens in units), initial=0))
+        count = len(units)
+
+        chunks = []
+        lo = hi = 0  # current chunk is units[lo:hi]
+
+        while hi < count:
+            index = max(bisect_right(sizes, sizes[lo] + self.budget) - 1, hi, lo + 1)
+            if index >= count:
+                hi = count
+                break
+
+            chunks.append(self._chunk(text, units, lo, index))
+
+            overlap_start = index
+            for previous in range(index - 1, max(lo, index - 3) - 1, -1):
+                overlap = sizes[index] - sizes[previous]
+                if overlap <= self.overlap_tokens and overlap + units[index][2] <= self.budget:
+                    overlap_start = previous
+                else:
+                    break
+            lo = overlap_start
+            hi = index + 1
+
+        if hi > lo:
+            chunks.append(self._chunk(text, units, lo, hi))
+
+        return chunks
+
+
+def count_truncated(tokenizer, chunks: List[str], max_tokens: int) -> int:
+    """How many chunks the embedding model would silently cut off at ``max_tokens``"""
+    return sum(count > max_tokens for count in _token_counts(tokenizer, chunks, add_special_tokens=True))
+
+
+def get_chunking_policy(
+    strategy: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    tokenizer=None,
+):
+    """Chunk sizes are characters, except for the token strategy where they are tokens"""
+    if strategy == "recursive":
+        return RecursivePolicy(chunk_size, chunk_overlap)
+    if strategy == "sentence":
+        return SentencePolicy(chunk_size, chunk_overlap)
+    if strategy == "token":
+        if tokenizer is None:
+            raise ValueError("The token chunking strategy needs a tokenizer")
+        return TokenBudgetPolicy(tokenizer, chunk_size, chunk_overlap)
+    raise ValueError(f"Invalid chunking strategy: {strategy}")
+
+
+def recursive_split_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    return [chunk.text(text) for chunk in RecursivePolicy(chunk_size, chunk_overlap).spans(text)]
+
+
+def sentence_split_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    return [chunk.text(text) for chunk in SentencePolicy(chunk_size, chunk_overlap).spans(text)]
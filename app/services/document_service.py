@@ -1,204 +1,422 @@
-from typing import Dict, List, Optional, Any, Type
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
 from fastapi import Depends, UploadFile, HTTPException
-import fitz
 from hashlib import sha256
-from sentence_transformers import SentenceTransformer
-from sqlalchemy.orm import Session
-from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct, VectorParams, Distance
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 import numpy as np
-import uuid
-import re
-from typing import List
-import re
-from app.core.database import get_db, get_qdrant
+import redis
+from app.core.database import get_db, get_redis
+from app.core.cache import bump_corpus_version
+from app.core.embeddings import EmbeddingModelRegistry, get_embedding_registry
 from app.core.config import Settings
+from app.core.telemetry import EMBEDDING_SECONDS, EMBEDDING_TEXTS, INGESTION_STAGE_SECONDS, timed
+from app.core.vector_store import VectorPoint, VectorStore, get_vector_store
 from app.models.document import Document, TextChunk
+from app.services.chunking import count_truncated, get_chunking_policy
+from app.services.embedding_store import ChunkEmbeddingStore, chunk_hash, point_id
+from app.services.extraction import PageText, iter_pdf_pages
 
 settings = Settings()
+logger = logging.getLogger(__name__)
 
+# Character sizes uploads and re-indexing use for the recursive and sentence strategies
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_OVERLAP = 200
 
 
-def recursive_split_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
-    chunks = []
-    separators = ["\n\n", "\n", ".", " "]
-    
-    def split_by_separator(text: str, separators: List[str]) -> List[str]:
-        if not separators:
-            return [text]
-            
-        separator = separators[0]
-        splits = text.split(separator)
-        
-        if len(splits) == 1:
-            return split_by_separator(text, separators[1:])
-            
-        results = []
-        current_chunk = ""
-        
-        for split in splits:
-            if not split:
-                continue
-                
-            potential_chunk = current_chunk + (separator if current_chunk else "") + split
-            
-            if len(potential_chunk) > chunk_size:
-                if current_chunk:
-                    results.extend(split_by_separator(current_chunk, separators[1:]))
-                results.extend(split_by_separator(split, separators[1:]))
-                current_chunk = ""
-            else:
-                current_chunk = potential_chunk
-                
-        if current_chunk:
-            results.extend(split_by_separator(current_chunk, separators[1:]))
-            
-        return results
-    
-    raw_chunks = split_by_separator(text, separators)
-    
-    for i, chunk in enumerate(raw_chunks):
-        chunks.append(chunk)
-        
-        if i < len(raw_chunks) - 1 and chunk_overlap > 0:
-            next_chunk = raw_chunks[i + 1]
-            if len(next_chunk) > chunk_overlap:
-                overlap = next_chunk[:chunk_overlap]
-                chunks[-1] = chunks[-1] + "\n" + overlap
-                
-    return chunks
-
-
-
-def sentence_split_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
-    # Split text into sentences using regex
-    sentences = re.split(r'(?<=[.!?])\s+', text.strip())
-    
-    chunks = []
-    current_chunk = []
-    current_size = 0
-    
-    for sentence in sentences:
-        sentence_size = len(sentence)
-        
-        if current_size + sentence_size > chunk_size and current_chunk:
-            chunks.append(" ".join(current_chunk))
-            
-            # Add overlap
-            overlap_chunk = []
-            overlap_size = 0
-            for prev_sentence in reversed(current_chunk[-3:]):  # last 3 sentences as overlap
-                if overlap_size + len(prev_sentence) <= chunk_overlap:
-                    overlap_chunk.insert(0, prev_sentence)
-                    overlap_size += len(prev_sentence)
-                else:
-                    break
-            current_chunk = overlap_chunk
-            current_size = sum(len(s) for s in current_chunk)
-        
-        current_chunk.append(sentence)
-        current_size += sentence_size
-    
-    if current_chunk:
-        chunks.append(" ".join(current_chunk))
-    
-    return chunks
-
-
-
-settings = Settings()
-
 class DocumentService:
     def __init__(
         self,
-        db: Session = Depends(get_db),
-        qdrant: QdrantClient = Depends(get_qdrant)
+        db: AsyncSession = Depends(get_db),
+        vector_store: VectorStore = Depends(get_vector_store),
+        embeddings: EmbeddingModelRegistry = Depends(get_embedding_registry),
+        redis_client: redis.Redis = Depends(get_redis)
     ):
         self.db = db
-        self.qdrant = qdrant
-        self.model = SentenceTransformer(settings.embedding_model)
+        self.vector_store = vector_store
+        self.redis = redis_client
+        self.embeddings = embeddings
 
     async def process_file(
         self,
         file: UploadFile,
         chunking_strategy: str = "recursive",
-        chunk_size: int = 1000,
-        chunk_overlap: int = 200
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        chunk_overlap: int = DEFAULT_CHUNK_OVERLAP
     ) -> Document:
-        
         file_content = await file.read()
+        return await self.process_content(file.filename, file_content, chunking_strategy, chunk_size, chunk_overlap)
+
+    async def process_content(
+        self,
+        filename: str,
+        file_content: bytes,
+        chunking_strategy: str = "recursive",
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+        on_progress: Optional[Callable[[Dict[str, int]], None]] = None,
+        worker_id: Optional[str] = None,
+        is_worker_alive: Optional[Callable[[str], bool]] = None
+    ) -> Document:
+        """Extract, chunk, embed and index a file; CPU-bound stages run in worker threads.
+
+        ``worker_id`` is recorded on the document while it is indexed, so a later upload of
+        the same file only takes over once ``is_worker_alive`` says that worker has stopped.
+        """
+        chunk_size, chunk_overlap = await self._chunk_params(chunking_strategy, chunk_size, chunk_overlap)
         file_hash = sha256(file_content).hexdigest()
 
-        existing_doc = self.db.query(Document).filter(Document.content_hash == file_hash).first()
-        if existing_doc:
+        existing_doc = await self.db.scalar(select(Document).where(Document.content_hash == file_hash))
+        if existing_doc and not self._is_abandoned(existing_doc, is_worker_alive):
             return existing_doc
 
-        text = ""
-        if file.filename.endswith(".pdf"):
-            doc = fitz.open(stream=file_content, filetype="pdf")
-            for page in doc:
-                text += page.get_text()
-        elif file.filename.endswith(".txt"):
-            text = file_content.decode("utf-8")
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file type")
+        timings: Dict[str, float] = {}
+        stage_start = time.perf_counter()
+        text, pages = await self._extract(filename, file_content)
+        timings["extract"] = time.perf_counter() - stage_start
+
+        if existing_doc:
+            logger.warning("Resuming unfinished ingestion of document %s", existing_doc.id)
+            await self._delete_index(existing_doc.id)
+            await self.db.execute(delete(Document).where(Document.id == existing_doc.id))
+            await self.db.commit()
 
         document = Document(
-            filename=file.filename,
+            filename=filename,
             content_hash=file_hash,
             chunking_strategy=chunking_strategy,
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
             doc_metadata ={
-                "original_filename": file.filename,
+                "original_filename": filename,
                 "file_size": len(file_content),
+                "status": "indexing",
+                "worker_id": worker_id,
                 "chunking_strategy": chunking_strategy,
                 "chunk_size": chunk_size,
                 "chunk_overlap": chunk_overlap
             }
         )
         self.db.add(document)
-        self.db.commit()
-
-        chunks = []
-        if chunking_strategy == "recursive":
-            chunks = recursive_split_text(text, chunk_size, chunk_overlap)
-        elif chunking_strategy == "sentence":
-            chunks = sentence_split_text(text, chunk_size, chunk_overlap)
-        else:
+        try:
+            await self.db.commit()
+        except IntegrityError:
+            # Another job inserted the same file meanwhile and is indexing it now
+            await self.db.rollback()
+            existing_doc = await self.db.scalar(select(Document).where(Document.content_hash == file_hash))
+            if existing_doc is None:
+                raise
+            return existing_doc
+        document_id = document.id
+        try:
+            # Kept so the document can be re-chunked later without another upload
+            await asyncio.to_thread(self._save_original, file_hash, file_content)
+            return await self._index(document, text, pages, timings, on_progress)
+        except Exception:
+            # Content-hash dedup would otherwise return the empty document on every retry
+            await self.db.rollback()
+            await self._discard(document_id, file_hash)
+            raise
+
+    async def reindex_document(
+        self,
+        document_id: int,
+        chunking_strategy: str = "recursive",
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+        on_progress: Optional[Callable[[Dict[str, int]], None]] = None,
+        worker_id: Optional[str] = None
+    ) -> Document:
+        """Re-chunk and re-embed a stored document, replacing its points and chunk rows.
+
+        The document is "indexing" while its index is rebuilt and "failed" if that fails.
+        """
+        document = await self.get_document(document_id)
+        if not self.has_original(document):
+            raise HTTPException(status_code=409, detail="Original file is not stored, upload the document again")
+        chunk_size, chunk_overlap = await self._chunk_params(chunking_strategy, chunk_size, chunk_overlap)
+
+        timings: Dict[str, float] = {}
+        stage_start = time.perf_counter()
+        file_content = await asyncio.to_thread(self._read_original, self._original_path(document.content_hash))
+        text, pages = await self._extract(document.filename, file_content)
+        timings["extract"] = time.perf_counter() - stage_start
+
+        await self._delete_index(document.id)
+        document.chunking_strategy = chunking_strategy
+        document.chunk_size = chunk_size
+        document.chunk_overlap = chunk_overlap
+        document.doc_metadata = {
+            **(document.doc_metadata or {}),
+            "status": "indexing",
+            "worker_id": worker_id,
+            "chunking_strategy": chunking_strategy,
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap
+        }
+        await self.db.commit()
+        try:
+            return await self._index(document, text, pages, timings, on_progress)
+        except Exception:
+            await self.db.rollback()
+            await self._mark_failed(document_id)
+            raise
+
+    async def delete_document(self, document_id: int):
+        """Delete a document with its vectors, chunk rows and stored original"""
+        document = await self.get_document(document_id)
+        await self._delete_index(document.id)
+        await self.db.delete(document)
+        await self.db.commit()
+        bump_corpus_version(self.redis)
+        await self._remove_unreferenced_original(document.content_hash)
+
+    async def _discard(self, document_id: int, content_hash: str):
+        """Remove what a failed ingestion left behind; errors are logged so the original one surfaces"""
+        try:
+            await self._delete_index(document_id)
+            await self.db.execute(delete(Document).where(Document.id == document_id))
+            await self.db.commit()
+            bump_corpus_version(self.redis)
+            await self._remove_unreferenced_original(content_hash)
+        except Exception:
+            logger.exception("Could not clean up document %s after a failed ingestion", document_id)
+            await self.db.rollback()
+
+    async def _mark_failed(self, document_id: int):
+        """Drop the partial index of a failed re-index and flag the document; errors are logged
+        so the original one surfaces"""
+        try:
+            await self._delete_index(document_id)
+            document = await self.db.get(Document, document_id)
+            if document is not None:
+                document.doc_metadata = {**(document.doc_metadata or {}), "status": "failed", "num_chunks": 0}
+            await self.db.commit()
+            bump_corpus_version(self.redis)
+        except Exception:
+            logger.exception("Could not mark document %s as failed after a failed re-index", document_id)
+            await self.db.rollback()
+
+    async def _remove_unreferenced_original(self, content_hash: str):
+        # A job that took over the same file may already have a new row using this original
+        if await self.db.scalar(select(Document.id).where(Document.content_hash == content_hash).limit(1)) is None:
+            await asyncio.to_thread(self._remove_original, content_hash)
+
+    @staticmethod
+    def _is_abandoned(document: Document, is_worker_alive: Optional[Callable[[str], bool]]) -> bool:
+        """A re-index failed, or it is still "indexing" and the worker that started it has
+        stopped heartbeating"""
+        metadata = document.doc_metadata or {}
+        if metadata.get("status") == "failed":
+            return True
+        if metadata.get("status") != "indexing":
+            return False
+        worker_id = metadata.get("worker_id")
+        return bool(worker_id and is_worker_alive and not is_worker_alive(worker_id))
+
+    async def get_document(self, document_id: int) -> Document:
+        document = await self.db.get(Document, document_id)
+        if document is None:
+            raise HTTPException(status_code=404, detail="Document not found")
+        return document
+
+    def has_original(self, document: Document) -> bool:
+        return os.path.exists(self._original_path(document.content_hash))
+
+    async def _chunk_params(self, chunking_strategy: str, chunk_size: int, chunk_overlap: int) -> Tuple[int, int]:
+        if chunking_strategy == "token":
+            # A cold metadata cache loads the model to read max_seq_length, so keep it off the event loop
+            max_tokens = settings.token_chunk_max_tokens or await asyncio.to_thread(self.embeddings.max_seq_length)
+            return max_tokens, settings.token_chunk_overlap
+        return chunk_size, chunk_overlap
+
+    async def _extract(self, filename: str, file_content: bytes) -> Tuple[str, Optional[PageText]]:
+        if filename.endswith(".pdf"):
+            pages = await asyncio.to_thread(PageText, iter_pdf_pages(file_content))
+            return pages.text, pages
+        if filename.endswith(".txt"):
+            return file_content.decode("utf-8"), None
+        raise HTTPException(status_code=400, detail="Unsupported file type")
+
+    async def _delete_index(self, document_id: int):
+        await self.vector_store.delete_document(document_id)
+        await self.db.execute(delete(TextChunk).where(TextChunk.document_id == document_id))
+
+    async def _index(
+        self,
+        document: Document,
+        text: str,
+        pages: Optional[PageText],
+        timings: Dict[str, float],
+        on_progress: Optional[Callable[[Dict[str, int]], None]] = None
+    ) -> Document:
+        progress = {"chunks_total": 0, "chunks_embedded": 0, "chunks_indexed": 0}
+
+        def report(**changes: int):
+            progress.update(changes)
+            if on_progress:
+                on_progress(dict(progress))
+
+        stage_start = time.perf_counter()
+        tokenizer = None
+        if document.chunking_strategy == "token":
+            tokenizer = await asyncio.to_thread(self.embeddings.tokenizer)
+        try:
+            policy = get_chunking_policy(
+                document.chunking_strategy,
+                document.chunk_size,
+                document.chunk_overlap,
+                tokenizer=tokenizer
+            )
+        except ValueError:
             raise HTTPException(status_code=400, detail="Invalid chunking strategy")
+        spans = await asyncio.to_thread(policy.spans, text)
+        chunks = [span.text(text) for span in spans]
+        page_spans = [pages.page_span(span.start, span.end) for span in spans] if pages else None
+        timings["chunk"] = time.perf_counter() - stage_start
+
+        truncation_report = None
+        if document.chunking_strategy == "token" and settings.chunking_truncation_report:
+            stage_start = time.perf_counter()
+            truncation_report = await asyncio.to_thread(self._truncation_report, text, chunks)
+            timings["truncation_report"] = time.perf_counter() - stage_start
+        report(chunks_total=len(chunks))
+
+        stage_start = time.perf_counter()
+        model_id = self.embeddings.model_id()
+        hashes = [chunk_hash(chunk_text, model_id) for chunk_text in chunks]
+        store = ChunkEmbeddingStore(self.db, model_id)
+        known = await store.get_many(hashes) if settings.chunk_embedding_reuse else {}
+        # Each distinct new text is encoded once, however many chunks repeat it
+        texts = dict(zip(hashes, chunks))
+        new_hashes = [content_hash for content_hash in texts if content_hash not in known]
+        reused = sum(1 for content_hash in hashes if content_hash in known)
+        report(chunks_embedded=reused)
+
+        # Encode in slices of a few batches so progress can be reported along the way
+        step = settings.embedding_batch_size * 4
+        for start in range(0, len(new_hashes), step):
+            batch = new_hashes[start:start + step]
+            with timed("embed_batch", EMBEDDING_SECONDS, kind="document"):
+                vectors = await asyncio.to_thread(self._encode, [texts[content_hash] for content_hash in batch])
+            EMBEDDING_TEXTS.labels(kind="document").inc(len(batch))
+            known.update(zip(batch, vectors))
+            if settings.chunk_embedding_reuse:
+                await store.put_many(list(zip(batch, vectors)))
+            report(chunks_embedded=sum(1 for content_hash in hashes if content_hash in known))
+        embeddings = [known[content_hash] for content_hash in hashes]
+        timings["embed"] = time.perf_counter() - stage_start
+
+        vector_ids = [point_id(document.id, i, content_hash) for i, content_hash in enumerate(hashes)]
 
-        for i, chunk_text in enumerate(chunks):
-            embedding = self.model.encode([chunk_text])[0]
-            
-            vector_id = str(uuid.uuid4())
-            
-            self.qdrant.upsert(
-                collection_name=settings.QDRANT_COLLECTION,
-                points=[PointStruct(
-                    id=vector_id,
-                    vector=embedding.tolist(),
-                    payload={"text": chunk_text, "doc_id": document.id}
-                )]
+        stage_start = time.perf_counter()
+        points = [
+            VectorPoint(
+                id=vector_id,
+                vector=embedding,
+                payload={
+                    "text": chunk_text,
+                    "doc_id": document.id,
+                    "chunk_index": i,
+                    **self._page_metadata(page_spans, i)
+                }
             )
-            
-            chunk = TextChunk(
-                document_id=document.id,
-                chunk_index=i,
-                content=chunk_text,
-                vector_id=vector_id,
-                chunk_metadata={
+            for i, (vector_id, chunk_text, embedding) in enumerate(zip(vector_ids, chunks, embeddings))
+        ]
+        await self.vector_store.upsert(
+            points,
+            on_batch=lambda count: report(chunks_indexed=progress["chunks_indexed"] + count)
+        )
+        timings["upsert"] = time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        chunk_rows = [
+            {
+                "document_id": document.id,
+                "chunk_index": i,
+                "content": chunk_text,
+                "vector_id": vector_id,
+                "chunk_metadata": {
                     "document_id": document.id,
                     "chunk_index": i,
                     "vector_id": vector_id,
                     "chunk_size": document.chunk_size,
                     "chunk_overlap": document.chunk_overlap,
-                    "strategy": document.chunking_strategy
+                    "strategy": document.chunking_strategy,
+                    "content_hash": content_hash,
+                    "char_start": span.start,
+                    "char_end": span.end,
+                    **self._page_metadata(page_spans, i)
                 }
-            )
-            self.db.add(chunk)
-        
-        self.db.commit()
+            }
+            for i, (chunk_text, vector_id, span, content_hash) in enumerate(zip(chunks, vector_ids, spans, hashes))
+        ]
+        if chunk_rows:
+            await self.db.execute(insert(TextChunk), chunk_rows)
+        timings["db_insert"] = time.perf_counter() - stage_start
+
+        for stage, seconds in timings.items():
+            INGESTION_STAGE_SECONDS.labels(stage=stage).observe(seconds)
+        timings = {stage: round(seconds, 4) for stage, seconds in timings.items()}
+        # Reassign so SQLAlchemy notices the change to the JSON column
+        document.doc_metadata = {
+            **document.doc_metadata,
+            "num_chunks": len(chunks),
+            "chunks_reused": reused,
+            "timings": timings,
+            "truncation_report": truncation_report,
+            "status": "indexed",
+        }
+        await self.db.commit()
+        bump_corpus_version(self.redis)
+
+        logger.info("Indexed %s: %d chunks (%d reused), timings %s", document.filename, len(chunks), reused, timings)
         return document
 
-  
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        # The model is only loaded here, in a worker thread, the first time it is needed
+        return self.embeddings.get().encode(texts, batch_size=settings.embedding_batch_size, convert_to_numpy=True)
+
+    @staticmethod
+    def _original_path(content_hash: str) -> str:
+        return os.path.join(settings.document_store_dir, content_hash)
+
+    def _save_original(self, content_hash: str, content: bytes):
+        os.makedirs(settings.document_store_dir, exist_ok=True)
+        with open(self._original_path(content_hash), "wb") as f:
+            f.write(content)
+
+    @staticmethod
+    def _read_original(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _remove_original(self, content_hash: str):
+        try:
+            os.remove(self._original_path(content_hash))
+        except OSError:
+            pass
+
+    def _truncation_report(self, text: str, token_chunks: List[str]) -> Dict[str, Dict[str, int]]:
+        """Chunk counts per strategy and how many would exceed the model's max_seq_length, with
+        the character strategies at the sizes uploads use for them"""
+        tokenizer = self.embeddings.tokenizer()
+        max_tokens = self.embeddings.max_seq_length()
+        report = {"token": {"chunks": len(token_chunks), "truncated": count_truncated(tokenizer, token_chunks, max_tokens)}}
+        for strategy in ("recursive", "sentence"):
+            policy = get_chunking_policy(strategy, DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP)
+            chunks = [span.text(text) for span in policy.spans(text)]
+            report[strategy] = {"chunks": len(chunks), "truncated": count_truncated(tokenizer, chunks, max_tokens)}
+        return report
+
+    @staticmethod
+    def _page_metadata(page_spans: Optional[List[Tuple[Optional[int], Optional[int]]]], index: int) -> Dict[str, int]:
+        if not page_spans:
+            return {}
+        page_start, page_end = page_spans[index]
+        return {"page_start": page_start, "page_end": page_end}
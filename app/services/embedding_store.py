@@ -0,0 +1,62 @@
+import re
+import unicodedata
+import uuid
+from hashlib import sha256
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.document import ChunkEmbedding
+
+# Fixed namespace so the same chunk of the same document always maps to the same point
+POINT_NAMESPACE = uuid.UUID("5b0c0b6e-3f7a-4c1e-9d2a-8e4f6a1c7b90")
+
+
+def chunk_hash(text: str, model_name: str) -> str:
+    """Content address of a chunk's embedding: the model plus whitespace/Unicode-normalized text"""
+    normalized = re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+    return sha256(f"{model_name}\x00{normalized}".encode("utf-8")).hexdigest()
+
+
+def point_id(document_id: int, chunk_index: int, content_hash: str) -> str:
+    """Deterministic Qdrant point ID, so re-running an ingestion overwrites instead of duplicating"""
+    return str(uuid.uuid5(POINT_NAMESPACE, f"{document_id}:{chunk_index}:{content_hash}"))
+
+
+class ChunkEmbeddingStore:
+    """Embeddings already computed for a chunk text, keyed by ``chunk_hash`` in Postgres"""
+
+    def __init__(self, db: AsyncSession, model_name: str, batch_size: int = 1000):
+        self.db = db
+        self.model_name = model_name
+        self.batch_size = batch_size
+
+    async def get_many(self, hashes: Sequence[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        unique = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique), self.batch_size):
+            rows = await self.db.execute(
+                select(ChunkEmbedding.content_hash, ChunkEmbedding.embedding)
+                .where(ChunkEmbedding.content_hash.in_(unique[start:start + self.batch_size]))
+            )
+            for content_hash, embedding in rows:
+                found[content_hash] = np.frombuffer(embedding, dtype=np.float32)
+        return found
+
+    async def put_many(self, items: List[Tuple[str, np.ndarray]]):
+        # A concurrent ingestion may have stored the same chunk first; either copy is fine
+        for start in range(0, len(items), self.batch_size):
+            await self.db.execute(
+                insert(ChunkEmbedding).on_conflict_do_nothing(index_elements=["content_hash"]),
+                [
+                    {
+                        "content_hash": content_hash,
+                        "model_name": self.model_name,
+                        "embedding": np.asarray(embedding, dtype=np.float32).tobytes(),
+                    }
+                    for content_hash, embedding in items[start:start + self.batch_size]
+                ],
+            )
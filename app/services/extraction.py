@@ -0,0 +1,126 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import Settings
+
+settings = Settings()
+
+# App-lifetime pools by size, so worker start-up and imports are paid once, not per PDF
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            # spawn avoids forking a process that already holds torch threads
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pools[workers] = pool
+        return pool
+
+
+def _discard_pool(workers: int, pool: ProcessPoolExecutor):
+    with _pools_lock:
+        if _pools.get(workers) is pool:
+            del _pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pools():
+    """Stop the extraction worker processes, on app shutdown"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _extract_page_range(path: str, start: int, end: int) -> List[str]:
+    # Runs in a worker process, which opens its own handle on the file
+    import fitz
+
+    with fitz.open(path) as doc:
+        return [doc[i].get_text() for i in range(start, end)]
+
+
+def iter_pdf_pages(
+    content: bytes,
+    workers: Optional[int] = None,
+    pages_per_task: Optional[int] = None,
+    parallel_min_pages: Optional[int] = None,
+) -> Iterator[Tuple[int, str]]:
+    """Yield ``(page_number, text)`` for each page in order, page numbers starting at 1.
+
+    Small documents are read in-process. Larger ones are split into page ranges that a
+    process pool extracts concurrently; ranges are yielded as soon as they and every
+    range before them are done.
+    """
+    workers = workers or settings.pdf_extract_workers
+    pages_per_task = pages_per_task or settings.pdf_pages_per_task
+    parallel_min_pages = parallel_min_pages or settings.pdf_parallel_min_pages
+    import fitz
+
+    with fitz.open(stream=content, filetype="pdf") as doc:
+        page_count = doc.page_count
+        if workers <= 1 or page_count < parallel_min_pages:
+            for i, page in enumerate(doc):
+                yield i + 1, page.get_text()
+            return
+
+    # Workers read from a file so the PDF bytes are not pickled into every task
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(content)
+        path = tmp.name
+
+    try:
+        ranges = [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+        pool = _get_pool(workers)
+        futures = [pool.submit(_extract_page_range, path, start, end) for start, end in ranges]
+        try:
+            for (start, _), future in zip(ranges, futures):
+                for offset, text in enumerate(future.result()):
+                    yield start + offset + 1, text
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); the next PDF gets a fresh pool
+            _discard_pool(workers, pool)
+            raise
+        finally:
+            # Ranges not read yet must not keep the shared workers busy
+            for future in futures:
+                future.cancel()
+    finally:
+        os.remove(path)
+
+
+class PageText:
+    """Concatenated document text plus the character offset where each page starts"""
+
+    def __init__(self, pages: Iterator[Tuple[int, str]]):
+        parts = []
+        self.page_numbers: List[int] = []
+        self.page_starts: List[int] = []
+        length = 0
+        for page_number, text in pages:
+            self.page_numbers.append(page_number)
+            self.page_starts.append(length)
+            parts.append(text)
+            length += len(text)
+        # One join instead of repeated += keeps this linear in the document size
+        self.text = "".join(parts)
+
+    def page_at(self, offset: int) -> Optional[int]:
+        if not self.page_starts:
+            return None
+        index = max(bisect_right(self.page_starts, offset) - 1, 0)
+        return self.page_numbers[index]
+
+    def page_span(self, start: int, end: int) -> Tuple[Optional[int], Optional[int]]:
+        """Pages covered by the character range ``[start, end)``"""
+        return self.page_at(start), self.page_at(max(start, end - 1))
@@ -0,0 +1,404 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Set
+
+import redis
+
+from app.core.config import Settings
+from app.core.database import SessionLocal, redis_client
+from app.core.embeddings import embedding_registry
+from app.core.telemetry import INGESTION_JOBS
+from app.core.vector_store import vector_store
+from app.schemas.document import JobStatus
+from app.services.document_service import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_SIZE, DocumentService
+
+settings = Settings()
+logger = logging.getLogger(__name__)
+
+
+class RedisJobStore:
+    """Job queue and status records in Redis, shared by every API worker.
+
+    A dequeued job moves to its worker's processing list and stays there until ``ack``.
+    Workers keep a heartbeat key alive; ``recover`` puts the jobs of workers whose
+    heartbeat has expired (crashed, OOM-killed, redeployed) back on the queue.
+    """
+
+    queue_key = "ingest:queue"
+    workers_key = "ingest:workers"
+
+    def __init__(self, redis_client: redis.Redis, ttl: int, heartbeat_ttl: int = 30):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.heartbeat_ttl = heartbeat_ttl
+
+    def _job_key(self, job_id: str) -> str:
+        return f"ingest:job:{job_id}"
+
+    def _processing_key(self, worker_id: str) -> str:
+        return f"ingest:processing:{worker_id}"
+
+    def _heartbeat_key(self, worker_id: str) -> str:
+        return f"ingest:worker:{worker_id}"
+
+    async def enqueue(self, job: Dict[str, Any]):
+        pipe = self.redis.pipeline()
+        pipe.set(self._job_key(job["job_id"]), json.dumps(job), ex=self.ttl)
+        pipe.lpush(self.queue_key, job["job_id"])
+        pipe.execute()
+
+    async def dequeue(self, worker_id: str, timeout: int = 1) -> Optional[str]:
+        # BLMOVE blocks, so keep it off the event loop
+        item = await asyncio.to_thread(
+            self.redis.blmove, self.queue_key, self._processing_key(worker_id), timeout, "RIGHT", "LEFT"
+        )
+        if item is None:
+            return None
+        return item.decode("utf-8") if isinstance(item, bytes) else item
+
+    def ack(self, worker_id: str, job_id: str):
+        self.redis.lrem(self._processing_key(worker_id), 1, job_id)
+
+    def heartbeat(self, worker_ids: List[str]):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.sadd(self.workers_key, *worker_ids)
+        for worker_id in worker_ids:
+            pipe.set(self._heartbeat_key(worker_id), 1, ex=self.heartbeat_ttl)
+        pipe.execute()
+
+    def retire(self, worker_ids: List[str]):
+        """Drop the heartbeats of stopping workers so their unfinished jobs are recovered at once"""
+        self.redis.delete(*[self._heartbeat_key(worker_id) for worker_id in worker_ids])
+
+    def is_alive(self, worker_id: str) -> bool:
+        return bool(self.redis.exists(self._heartbeat_key(worker_id)))
+
+    def recover(self) -> List[str]:
+        """Requeue the jobs of workers whose heartbeat has expired; returns their IDs"""
+        recovered = []
+        for raw in self.redis.smembers(self.workers_key):
+            worker_id = raw.decode("utf-8") if isinstance(raw, bytes) else raw
+            if self.redis.exists(self._heartbeat_key(worker_id)):
+                continue
+            # LMOVE is atomic, so concurrent recoverers never requeue a job twice
+            while True:
+                job_id = self.redis.lmove(self._processing_key(worker_id), self.queue_key, "RIGHT", "RIGHT")
+                if job_id is None:
+                    break
+                job_id = job_id.decode("utf-8") if isinstance(job_id, bytes) else job_id
+                self.update(job_id, status=JobStatus.QUEUED.value)
+                recovered.append(job_id)
+            self.redis.srem(self.workers_key, worker_id)
+        return recovered
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raw = self.redis.get(self._job_key(job_id))
+        return json.loads(raw) if raw else None
+
+    def update(self, job_id: str, **fields: Any):
+        job = self.get(job_id) or {"job_id": job_id}
+        job.update(fields, updated_at=time.time())
+        self.redis.set(self._job_key(job_id), json.dumps(job), ex=self.ttl)
+
+    def queue_depth(self) -> int:
+        return self.redis.llen(self.queue_key)
+
+
+class LocalJobStore:
+    """In-process stand-in for RedisJobStore, for single-worker and test deployments"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: Set[str] = set()
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+    async def enqueue(self, job: Dict[str, Any]):
+        self._jobs[job["job_id"]] = dict(job)
+        await self.queue.put(job["job_id"])
+
+    async def dequeue(self, worker_id: str, timeout: int = 1) -> Optional[str]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    # Jobs live and die with this process, so there is nothing to hand over to other workers
+    def ack(self, worker_id: str, job_id: str):
+        pass
+
+    def heartbeat(self, worker_ids: List[str]):
+        self._workers.update(worker_ids)
+
+    def retire(self, worker_ids: List[str]):
+        self._workers.difference_update(worker_ids)
+
+    def recover(self) -> List[str]:
+        return []
+
+    def is_alive(self, worker_id: str) -> bool:
+        return worker_id in self._workers
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job else None
+
+    def update(self, job_id: str, **fields: Any):
+        self._jobs.setdefault(job_id, {"job_id": job_id}).update(fields, updated_at=time.time())
+
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+
+class IngestionJobQueue:
+    """Accepts uploads as jobs and runs them on a pool of background workers.
+
+    Uploaded files are written to ``upload_dir``; with the Redis store every API
+    container that runs workers must see the same directory (e.g. a shared volume).
+    """
+
+    def __init__(
+        self,
+        store,
+        upload_dir: str,
+        num_workers: int = 2,
+        max_attempts: int = 3,
+        heartbeat_interval: float = 10.0,
+    ):
+        self.store = store
+        self.upload_dir = upload_dir
+        self.num_workers = num_workers
+        self.max_attempts = max_attempts
+        self.heartbeat_interval = heartbeat_interval
+        # Unique per process start, a restarted container must not adopt its old processing lists
+        prefix = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self.worker_ids = [f"{prefix}-{i}" for i in range(num_workers)]
+        self._workers: List[asyncio.Task] = []
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    async def submit(
+        self,
+        filename: str,
+        file_content: bytes,
+        chunking_strategy: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+    ) -> Dict[str, Any]:
+        job_id = str(uuid.uuid4())
+        os.makedirs(self.upload_dir, exist_ok=True)
+        path = os.path.join(self.upload_dir, job_id)
+        await asyncio.to_thread(self._write_file, path, file_content)
+
+        job = {
+            "job_id": job_id,
+            "filename": filename,
+            "path": path,
+            "chunking_strategy": chunking_strategy,
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "status": JobStatus.QUEUED.value,
+            "chunks_total": 0,
+            "chunks_embedded": 0,
+            "chunks_indexed": 0,
+            "document_id": None,
+            "timings": None,
+            "error": None,
+            "created_at": time.time(),
+        }
+        await self.store.enqueue(job)
+        return job
+
+    async def submit_reindex(
+        self,
+        document_id: int,
+        filename: str,
+        chunking_strategy: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+    ) -> Dict[str, Any]:
+        """Queue re-chunking of an existing document from its stored original"""
+        job = {
+            "job_id": str(uuid.uuid4()),
+            "action": "reindex",
+            "filename": filename,
+            "path": None,
+            "chunking_strategy": chunking_strategy,
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "status": JobStatus.QUEUED.value,
+            "chunks_total": 0,
+            "chunks_embedded": 0,
+            "chunks_indexed": 0,
+            "document_id": str(document_id),
+            "timings": None,
+            "error": None,
+            "created_at": time.time(),
+        }
+        await self.store.enqueue(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    async def start(self):
+        if not self._workers:
+            # Registered before the first dequeue, and finds jobs orphaned by earlier processes
+            self._heartbeat = asyncio.create_task(self._keep_alive())
+            self._workers = [asyncio.create_task(self._worker(worker_id)) for worker_id in self.worker_ids]
+
+    async def stop(self):
+        tasks = [*self._workers, *([self._heartbeat] if self._heartbeat else [])]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._heartbeat = None
+        try:
+            self.store.retire(self.worker_ids)
+        except redis.RedisError as e:
+            logger.warning("Could not retire ingestion workers: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": len(self._workers), "queue_depth": self.store.queue_depth()}
+
+    @staticmethod
+    def _write_file(path: str, content: bytes):
+        with open(path, "wb") as f:
+            f.write(content)
+
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def _keep_alive(self):
+        while True:
+            try:
+                self.store.heartbeat(self.worker_ids)
+                for job_id in self.store.recover():
+                    logger.warning("Requeued ingestion job %s from a stopped worker", job_id)
+            except redis.RedisError as e:
+                logger.warning("Ingestion heartbeat failed: %s", e)
+            await asyncio.sleep(self.heartbeat_interval)
+
+    async def _worker(self, worker_id: str):
+        while True:
+            try:
+                job_id = await self.store.dequeue(worker_id)
+            except redis.RedisError as e:
+                logger.warning("Ingestion queue unavailable: %s", e)
+                await asyncio.sleep(1)
+                continue
+            if job_id is None:
+                continue
+            await self._run_job(worker_id, job_id)
+            # Left in the processing list if the process dies first, so the job is recovered
+            self.store.ack(worker_id, job_id)
+
+    async def _run_job(self, worker_id: str, job_id: str):
+        job = self.store.get(job_id)
+        if job is None:
+            return
+
+        attempts = job.get("attempts", 0) + 1
+        if attempts > self.max_attempts:
+            # A job that keeps killing its worker (e.g. OOM on a huge PDF) must not loop forever
+            self.store.update(
+                job_id,
+                status=JobStatus.FAILED.value,
+                error=f"Gave up after {self.max_attempts} attempts, the worker stopped while running it",
+            )
+            INGESTION_JOBS.labels(status=JobStatus.FAILED.value).inc()
+            self._remove_upload(job["path"])
+            return
+
+        self.store.update(job_id, status=JobStatus.RUNNING.value, attempts=attempts)
+        db = SessionLocal()
+        keep_upload = False
+        try:
+            service = DocumentService(
+                db=db,
+                vector_store=vector_store,
+                embeddings=embedding_registry,
+                redis_client=redis_client,
+            )
+            on_progress = lambda progress: self.store.update(job_id, **progress)
+            if job.get("action") == "reindex":
+                document = await service.reindex_document(
+                    int(job["document_id"]),
+                    job["chunking_strategy"],
+                    job["chunk_size"],
+                    job["chunk_overlap"],
+                    on_progress=on_progress,
+                    worker_id=worker_id,
+                )
+            else:
+                file_content = await asyncio.to_thread(self._read_file, job["path"])
+                document = await service.process_content(
+                    job["filename"],
+                    file_content,
+                    job["chunking_strategy"],
+                    job["chunk_size"],
+                    job["chunk_overlap"],
+                    on_progress=on_progress,
+                    worker_id=worker_id,
+                    is_worker_alive=self.store.is_alive,
+                )
+            self.store.update(
+                job_id,
+                status=JobStatus.COMPLETED.value,
+                document_id=str(document.id),
+                timings=(document.doc_metadata or {}).get("timings"),
+            )
+            INGESTION_JOBS.labels(status=JobStatus.COMPLETED.value).inc()
+        except Exception as e:
+            logger.exception("Ingestion job %s failed", job_id)
+            await db.rollback()
+            self.store.update(job_id, status=JobStatus.FAILED.value, error=str(e))
+            INGESTION_JOBS.labels(status=JobStatus.FAILED.value).inc()
+        except asyncio.CancelledError:
+            # Shutting down mid-job: the upload is kept for whichever worker recovers the job
+            keep_upload = True
+            raise
+        finally:
+            await db.close()
+            if not keep_upload:
+                self._remove_upload(job["path"])
+
+    @staticmethod
+    def _remove_upload(path: Optional[str]):
+        if path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+if settings.ingestion_backend == "redis":
+    _job_store = RedisJobStore(
+        redis_client, ttl=settings.ingestion_job_ttl, heartbeat_ttl=settings.ingestion_heartbeat_ttl
+    )
+else:
+    _job_store = LocalJobStore()
+
+ingestion_queue = IngestionJobQueue(
+    _job_store,
+    upload_dir=settings.upload_dir,
+    num_workers=settings.ingestion_workers,
+    max_attempts=settings.ingestion_max_attempts,
+    heartbeat_interval=settings.ingestion_heartbeat_ttl / 3,
+)
+
+
+def get_ingestion_queue() -> IngestionJobQueue:
+    return ingestion_queue
@@ -0,0 +1,184 @@
+import math
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from app.core.config import Settings
+
+settings = Settings()
+
+
+class ContextBlock(NamedTuple):
+    """One or more retrieved chunks from the same document, merged into a single passage"""
+    doc_id: Any
+    chunk_indexes: Tuple[int, ...]
+    text: str
+    rank: int
+
+
+def _overlap(left: str, right: str, min_overlap: int = 8) -> int:
+    """Length of the longest suffix of ``left`` that is also a prefix of ``right``.
+
+    Overlaps shorter than ``min_overlap`` characters are ignored as coincidental.
+    """
+    probe = right[:min_overlap]
+    if len(probe) < min_overlap:
+        return 0
+    position = max(len(left) - len(right), 0)
+    while True:
+        position = left.find(probe, position)
+        if position == -1:
+            return 0
+        if right.startswith(left[position:]):
+            return len(left) - position
+        position += 1
+
+
+def merge_chunks(hits: Sequence[Any]) -> List[ContextBlock]:
+    """Collapse retrieved chunks into passages, best-ranked first.
+
+    Neighbouring chunks of one document (consecutive ``chunk_index``) are joined with
+    the text they share through chunk overlap written once; exact repeats and chunks
+    contained in another hit from the same document are dropped.
+    """
+    blocks: List[ContextBlock] = []
+    by_doc: Dict[Any, List[ContextBlock]] = {}
+    seen = set()
+    for rank, hit in enumerate(hits):
+        payload = hit.payload or {}
+        text = payload.get("text", "")
+        if not text.strip() or text in seen:
+            continue
+        seen.add(text)
+        index = payload.get("chunk_index")
+        block = ContextBlock(payload.get("doc_id"), (index,) if index is not None else (), text, rank)
+        if index is None:
+            blocks.append(block)
+        else:
+            by_doc.setdefault(block.doc_id, []).append(block)
+
+    for doc_blocks in by_doc.values():
+        doc_blocks.sort(key=lambda block: block.chunk_indexes[0])
+        merged = [doc_blocks[0]]
+        for block in doc_blocks[1:]:
+            previous = merged[-1]
+            if block.chunk_indexes[0] - previous.chunk_indexes[-1] <= 1:
+                shared = _overlap(previous.text, block.text)
+                text = previous.text + (block.text[shared:] if shared else "\n" + block.text)
+                merged[-1] = ContextBlock(
+                    previous.doc_id,
+                    previous.chunk_indexes + block.chunk_indexes,
+                    text,
+                    min(previous.rank, block.rank),
+                )
+            else:
+                merged.append(block)
+        blocks.extend(
+            block for block in merged
+            if not any(block is not other and block.text in other.text for other in merged)
+        )
+
+    return sorted(blocks, key=lambda block: block.rank)
+
+
+class PromptBudgeter:
+    """Fits retrieved context and chat history into a prompt token budget.
+
+    Merged context is placed first, leaving up to ``history_reserve`` tokens for
+    history; history then fills what is left, newest turns first, so the oldest turns
+    are the first to go. Counts use ``tokenizer_name`` when set, otherwise a
+    characters-per-token estimate.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int,
+        history_reserve: int = 512,
+        chars_per_token: float = 4.0,
+        tokenizer_name: Optional[str] = None,
+    ):
+        self.max_tokens = max_tokens
+        self.history_reserve = history_reserve
+        self.chars_per_token = chars_per_token
+        self.tokenizer_name = tokenizer_name
+        self._tokenizer = None
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None and self.tokenizer_name:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name)
+        return self._tokenizer
+
+    def count(self, text: str) -> int:
+        if self.tokenizer is not None:
+            return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        tokens = self.count(text)
+        while tokens > max_tokens and text:
+            text = text[:int(len(text) * max_tokens / tokens * 0.95)]
+            tokens = self.count(text)
+        return text
+
+    def fit(
+        self,
+        fixed: Sequence[str],
+        hits: Sequence[Any],
+        history: Sequence[Dict[str, str]],
+    ) -> Tuple[str, List[Dict[str, str]], Dict[str, int]]:
+        """Return ``(context, history, usage)``; ``history`` is chronological in and out"""
+        fixed_tokens = sum(self.count(text) for text in fixed)
+        available = max(self.max_tokens - fixed_tokens, 0)
+        history_tokens = [self.count(message["content"]) for message in history]
+        context_budget = max(available - min(self.history_reserve, sum(history_tokens)), 0)
+
+        blocks = merge_chunks(hits)
+        passages = []
+        context_tokens = 0
+        for block in blocks:
+            tokens = self.count(block.text)
+            if context_tokens + tokens <= context_budget:
+                passages.append(block.text)
+                context_tokens += tokens
+                continue
+            # Cut the passage that crosses the budget rather than dropping it outright
+            remaining = context_budget - context_tokens
+            if remaining > 0:
+                text = self._truncate(block.text, remaining)
+                if text:
+                    passages.append(text)
+                    context_tokens += self.count(text)
+            break
+
+        remaining = available - context_tokens
+        kept = 0
+        kept_tokens = 0
+        for tokens in reversed(history_tokens):
+            if kept_tokens + tokens > remaining:
+                break
+            kept += 1
+            kept_tokens += tokens
+
+        usage = {
+            "prompt_tokens": fixed_tokens + context_tokens + kept_tokens,
+            "context_tokens": context_tokens,
+            "history_tokens": kept_tokens,
+            "budget": self.max_tokens,
+            "chunks_retrieved": len(hits),
+            "context_passages": len(passages),
+            "history_messages": kept,
+            "history_dropped": len(history) - kept,
+        }
+        return "\n\n".join(passages), list(history[len(history) - kept:]), usage
+
+
+prompt_budgeter = PromptBudgeter(
+    max_tokens=settings.prompt_max_tokens,
+    history_reserve=settings.prompt_history_reserve,
+    chars_per_token=settings.prompt_chars_per_token,
+    tokenizer_name=settings.prompt_tokenizer,
+)
+
+
+def get_prompt_budgeter() -> PromptBudgeter:
+    return prompt_budgeter
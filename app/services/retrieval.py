@@ -0,0 +1,127 @@
+import asyncio
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+from fastapi import Depends
+from qdrant_client.models import ScoredPoint
+from sqlalchemy import Text, cast, func, literal_column, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import Settings
+from app.core.database import get_db
+from app.core.telemetry import VECTOR_SEARCH_SECONDS, timed
+from app.core.vector_store import VectorStore, get_vector_store
+from app.models.document import TextChunk
+from app.schemas.chat import RetrievalMode, RetrievalOptions
+
+settings = Settings()
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[Hashable]],
+    weights: Sequence[float],
+    k: int = 60,
+) -> List[tuple]:
+    """Merge ranked id lists into ``(id, score)`` pairs, best first.
+
+    Each list contributes ``weight / (k + rank)`` per id, so only ranks matter and the
+    incomparable dense and lexical scores never have to be normalised.
+    """
+    scores: Dict[Hashable, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        if weight <= 0:
+            continue
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class Retriever:
+    """First-stage retrieval: dense vector search, optionally fused with Postgres full-text search"""
+
+    def __init__(
+        self,
+        vector_store: VectorStore = Depends(get_vector_store),
+        db: AsyncSession = Depends(get_db),
+    ):
+        self.vector_store = vector_store
+        self.db = db
+
+    async def retrieve(
+        self,
+        query: str,
+        query_vector: List[float],
+        options: Optional[RetrievalOptions] = None,
+    ) -> List[ScoredPoint]:
+        options = options or RetrievalOptions()
+        mode = options.mode or RetrievalMode(settings.retrieval_mode)
+        top_k = options.top_k or settings.retrieval_top_k
+        if mode == RetrievalMode.DENSE:
+            return await self.dense_search(query_vector, top_k, options.document_ids)
+
+        candidates = max(settings.retrieval_candidates, top_k)
+        dense_hits, sparse_hits = await asyncio.gather(
+            self.dense_search(query_vector, candidates, options.document_ids),
+            self.lexical_search(query, limit=candidates, document_ids=options.document_ids),
+        )
+
+        hits = {str(hit.id): hit for hit in sparse_hits}
+        # Prefer the dense copy of a hit, its payload comes straight from Qdrant
+        hits.update((str(hit.id), hit) for hit in dense_hits)
+        fused = reciprocal_rank_fusion(
+            [[str(hit.id) for hit in dense_hits], [str(hit.id) for hit in sparse_hits]],
+            [
+                settings.hybrid_dense_weight if options.dense_weight is None else options.dense_weight,
+                settings.hybrid_sparse_weight if options.sparse_weight is None else options.sparse_weight,
+            ],
+            k=settings.rrf_k,
+        )
+        return [hits[key].model_copy(update={"score": score}) for key, score in fused[:top_k]]
+
+    async def dense_search(
+        self,
+        query_vector: List[float],
+        top_k: int,
+        document_ids: Optional[List[int]] = None,
+    ) -> List[ScoredPoint]:
+        with timed("vector_search", VECTOR_SEARCH_SECONDS, backend=self.vector_store.name):
+            return await self.vector_store.search(query_vector, top_k=top_k, document_ids=document_ids)
+
+    async def lexical_search(
+        self,
+        query: str,
+        limit: int,
+        document_ids: Optional[List[int]] = None,
+    ) -> List[ScoredPoint]:
+        """Rank chunks by full-text match, returned in the same shape as Qdrant hits"""
+        # Inlined rather than bound so the planner can match the expression index
+        config = literal_column(f"'{settings.text_search_config}'::regconfig")
+        document = func.to_tsvector(config, TextChunk.content)
+        # OR the query terms together; plainto_tsquery alone would require every term to match
+        terms = func.replace(cast(func.plainto_tsquery(config, query), Text), "&", "|")
+        ts_query = func.to_tsquery(config, terms)
+        rank = func.ts_rank_cd(document, ts_query).label("rank")
+
+        statement = (
+            select(
+                TextChunk.vector_id,
+                TextChunk.document_id,
+                TextChunk.chunk_index,
+                TextChunk.content,
+                TextChunk.chunk_metadata,
+                rank,
+            )
+            .where(document.op("@@")(ts_query))
+            .order_by(rank.desc())
+            .limit(limit)
+        )
+        if document_ids:
+            statement = statement.where(TextChunk.document_id.in_(document_ids))
+        rows = await self.db.execute(statement)
+        return [self._to_point(row) for row in rows]
+
+    @staticmethod
+    def _to_point(row: Any) -> ScoredPoint:
+        metadata = row.chunk_metadata or {}
+        payload = {"text": row.content, "doc_id": row.document_id, "chunk_index": row.chunk_index}
+        payload.update({key: metadata[key] for key in ("page_start", "page_end") if key in metadata})
+        return ScoredPoint(id=row.vector_id, version=0, score=float(row.rank), payload=payload)
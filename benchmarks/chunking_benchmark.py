@@ -0,0 +1,180 @@
+"""Micro-benchmark for the chunking strategies on multi-MB inputs.
+
+Compares the offset-based policies in app.services.chunking against the original
+string-building implementations (kept below as the baseline) and checks that both
+produce identical chunks.
+
+    python -m benchmarks.chunking_benchmark --sizes-mb 1 4 --chunk-size 1000 --overlap 200
+"""
+import argparse
+import json
+import random
+import re
+import time
+from typing import List
+
+from app.services.chunking import get_chunking_policy
+
+
+def legacy_recursive_split_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    chunks = []
+    separators = ["\n\n", "\n", ".", " "]
+
+    def split_by_separator(text: str, separators: List[str]) -> List[str]:
+        if not separators:
+            return [text]
+
+        separator = separators[0]
+        splits = text.split(separator)
+
+        if len(splits) == 1:
+            return split_by_separator(text, separators[1:])
+
+        results = []
+        current_chunk = ""
+
+        for split in splits:
+            if not split:
+                continue
+
+            potential_chunk = current_chunk + (separator if current_chunk else "") + split
+
+            if len(potential_chunk) > chunk_size:
+                if current_chunk:
+                    results.extend(split_by_separator(current_chunk, separators[1:]))
+                results.extend(split_by_separator(split, separators[1:]))
+                current_chunk = ""
+            else:
+                current_chunk = potential_chunk
+
+        if current_chunk:
+            results.extend(split_by_separator(current_chunk, separators[1:]))
+
+        return results
+
+    raw_chunks = split_by_separator(text, separators)
+
+    for i, chunk in enumerate(raw_chunks):
+        chunks.append(chunk)
+
+        if i < len(raw_chunks) - 1 and chunk_overlap > 0:
+            next_chunk = raw_chunks[i + 1]
+            if len(next_chunk) > chunk_overlap:
+                overlap = next_chunk[:chunk_overlap]
+                chunks[-1] = chunks[-1] + "\n" + overlap
+
+    return chunks
+
+
+def legacy_sentence_split_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    sentences = re.split(r'(?<=[.!?])\s+', text.strip())
+
+    chunks = []
+    current_chunk = []
+    current_size = 0
+
+    for sentence in sentences:
+        sentence_size = len(sentence)
+
+        if current_size + sentence_size > chunk_size and current_chunk:
+            chunks.append(" ".join(current_chunk))
+
+            overlap_chunk = []
+            overlap_size = 0
+            for prev_sentence in reversed(current_chunk[-3:]):
+                if overlap_size + len(prev_sentence) <= chunk_overlap:
+                    overlap_chunk.insert(0, prev_sentence)
+                    overlap_size += len(prev_sentence)
+                else:
+                    break
+            current_chunk = overlap_chunk
+            current_size = sum(len(s) for s in current_chunk)
+
+        current_chunk.append(sentence)
+        current_size += sentence_size
+
+    if current_chunk:
+        chunks.append(" ".join(current_chunk))
+
+    return chunks
+
+
+LEGACY = {
+    "recursive": legacy_recursive_split_text,
+    "sentence": legacy_sentence_split_text,
+}
+
+
+def synthetic_text(size_bytes: int, seed: int = 0) -> str:
+    """Prose-like text with sentences, line breaks and paragraphs"""
+    rng = random.Random(seed)
+    words = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit",
+             "sed", "do", "eiusmod", "tempor", "incididunt", "ut", "labore", "et", "dolore"]
+    parts = []
+    length = 0
+    while length < size_bytes:
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(5, 25)))
+        sentence = sentence.capitalize() + rng.choice([".", ".", ".", "?", "!"])
+        separator = rng.choices([" ", "\n", "\n\n"], weights=[12, 2, 1])[0]
+        parts.append(sentence + separator)
+        length += len(sentence) + len(separator)
+    return "".join(parts)
+
+
+def best_of(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 4])
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--overlap", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = []
+    for size_mb in args.sizes_mb:
+        text = synthetic_text(int(size_mb * 1024 * 1024))
+        for strategy, legacy in LEGACY.items():
+            policy = get_chunking_policy(strategy, args.chunk_size, args.overlap)
+
+            spans = policy.spans(text)
+            identical = [span.text(text) for span in spans] == legacy(text, args.chunk_size, args.overlap)
+
+            legacy_seconds = best_of(lambda: legacy(text, args.chunk_size, args.overlap), args.repeat)
+            spans_seconds = best_of(lambda: policy.spans(text), args.repeat)
+            strings_seconds = best_of(lambda: [span.text(text) for span in policy.spans(text)], args.repeat)
+
+            results.append({
+                "size_mb": size_mb,
+                "strategy": strategy,
+                "chunks": len(spans),
+                "identical": identical,
+                "legacy_s": round(legacy_seconds, 4),
+                "spans_s": round(spans_seconds, 4),
+                "spans_and_strings_s": round(strings_seconds, 4),
+                "speedup": round(legacy_seconds / strings_seconds, 2) if strings_seconds else None,
+            })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    header = f"{'size_mb':>8} {'strategy':>10} {'chunks':>7} {'same':>5} {'legacy_s':>9} {'spans_s':>8} {'+text_s':>8} {'speedup':>8}"
+    print(header)
+    for row in results:
+        print(
+            f"{row['size_mb']:>8} {row['strategy']:>10} {row['chunks']:>7} {str(row['identical']):>5} "
+            f"{row['legacy_s']:>9} {row['spans_s']:>8} {row['spans_and_strings_s']:>8} {row['speedup']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
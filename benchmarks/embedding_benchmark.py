@@ -0,0 +1,109 @@
+"""Embedding throughput and accuracy per backend, on chunks shaped like ours.
+
+Chunks a text (a file, or synthetic prose) with the configured chunking strategy and
+size, encodes them with each backend and reports sentences/sec plus the cosine
+similarity of every vector to the PyTorch fp32 one for the same chunk.
+
+    python -m benchmarks.embedding_benchmark --backends torch onnx onnx-int8 --threads 4
+    python -m benchmarks.embedding_benchmark --file corpus.txt --chunk-size 1500 --json
+
+ONNX backends need ``optimum[onnxruntime]``; exported models are cached in --export-dir.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.core.config import Settings
+from app.core.embeddings import BACKENDS, EmbeddingModelRegistry
+from app.services.chunking import get_chunking_policy
+from benchmarks.chunking_benchmark import synthetic_text
+
+settings = Settings()
+
+
+def encode(model, chunks, batch_size: int) -> np.ndarray:
+    return model.encode(chunks, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=settings.embedding_model)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--file", help="text file to chunk, synthetic prose when omitted")
+    parser.add_argument("--strategy", default="recursive")
+    parser.add_argument("--chunk-size", type=int, default=settings.chunk_size)
+    parser.add_argument("--overlap", type=int, default=settings.chunk_overlap)
+    parser.add_argument("--chunks", type=int, default=256, help="number of chunks to encode")
+    parser.add_argument("--batch-size", type=int, default=settings.embedding_batch_size)
+    parser.add_argument("--threads", type=int, default=settings.embedding_num_threads)
+    parser.add_argument("--quantization-config", default=settings.embedding_quantization_config)
+    parser.add_argument("--export-dir", default=settings.embedding_export_dir)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = synthetic_text(args.chunks * args.chunk_size * 2)
+    policy = get_chunking_policy(args.strategy, args.chunk_size, args.overlap)
+    chunks = [span.text(text) for span in policy.spans(text)][:args.chunks]
+
+    # fp32 PyTorch is the reference every backend is compared with
+    backends = ["torch"] + [backend for backend in args.backends if backend != "torch"]
+    baseline = None
+    results = []
+    for backend in backends:
+        registry = EmbeddingModelRegistry(
+            device="cpu",
+            num_threads=args.threads,
+            backend=backend,
+            export_dir=args.export_dir,
+            quantization_config=args.quantization_config,
+        )
+        start = time.perf_counter()
+        model = registry.get(args.model)
+        load_seconds = time.perf_counter() - start
+        encode(model, chunks[:args.batch_size], args.batch_size)
+
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            vectors = encode(model, chunks, args.batch_size)
+            timings.append(time.perf_counter() - start)
+        if baseline is None:
+            baseline = vectors
+        cosine = np.sum(vectors * baseline, axis=1)
+
+        if backend in args.backends:
+            results.append({
+                "backend": backend,
+                "chunks": len(chunks),
+                "avg_chars": round(sum(map(len, chunks)) / len(chunks)),
+                "load_s": round(load_seconds, 2),
+                "sentences_per_s": round(len(chunks) / min(timings), 1),
+                "mean_cosine": round(float(cosine.mean()), 5),
+                "min_cosine": round(float(cosine.min()), 5),
+            })
+
+    torch_rate = next((row["sentences_per_s"] for row in results if row["backend"] == "torch"), None)
+    for row in results:
+        row["speedup"] = round(row["sentences_per_s"] / torch_rate, 2) if torch_rate else None
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'backend':>10} {'chunks':>7} {'chars':>6} {'load_s':>7} {'sent/s':>8} {'speedup':>8} {'mean_cos':>9} {'min_cos':>9}")
+    for row in results:
+        print(
+            f"{row['backend']:>10} {row['chunks']:>7} {row['avg_chars']:>6} {row['load_s']:>7} "
+            f"{row['sentences_per_s']:>8} {str(row['speedup']):>8} {row['mean_cosine']:>9} {row['min_cosine']:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
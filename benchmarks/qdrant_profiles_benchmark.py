@@ -0,0 +1,188 @@
+"""Memory, latency and recall@k of Qdrant collection profiles against full precision.
+
+Loads the same vectors into a scratch collection per profile, waits for the HNSW
+index to be built, then runs every query through each one. Recall is measured
+against exact (brute-force, float32) nearest neighbours. Memory is an estimate of
+what the profile keeps resident: original vectors unless on disk, quantized
+vectors, and the HNSW graph links.
+
+    python -m benchmarks.qdrant_profiles_benchmark --points 50000 --dim 768 --top-k 10
+    python -m benchmarks.qdrant_profiles_benchmark --from-collection documents --oversampling 3
+
+Needs a running Qdrant (QDRANT_HOST/QDRANT_PORT); scratch collections are dropped afterwards.
+"""
+import argparse
+import json
+import time
+import uuid
+from typing import Dict, List, Tuple
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import CollectionStatus, OptimizersConfigDiff, PointStruct
+
+from app.core.config import Settings
+from app.core.qdrant_profiles import CollectionProfile, SearchProfile, create_collection
+
+settings = Settings()
+
+
+def profiles(args) -> Dict[str, Tuple[CollectionProfile, SearchProfile]]:
+    hnsw = {"hnsw_m": args.hnsw_m, "hnsw_ef_construct": args.hnsw_ef_construct}
+    search = SearchProfile(hnsw_ef=args.hnsw_ef, rescore=True, oversampling=args.oversampling)
+    return {
+        "full": (CollectionProfile(**hnsw), SearchProfile(hnsw_ef=args.hnsw_ef)),
+        "full-disk": (CollectionProfile(on_disk=True, **hnsw), SearchProfile(hnsw_ef=args.hnsw_ef)),
+        "scalar": (CollectionProfile(quantization="scalar", on_disk=True, **hnsw), search),
+        "scalar-norescore": (CollectionProfile(quantization="scalar", on_disk=True, **hnsw), search._replace(rescore=False)),
+        "binary": (CollectionProfile(quantization="binary", on_disk=True, **hnsw), search),
+        "binary-norescore": (CollectionProfile(quantization="binary", on_disk=True, **hnsw), search._replace(rescore=False)),
+    }
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def synthetic_vectors(points: int, queries: int, dim: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Clustered unit vectors; uniform random ones make every neighbour equally far"""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((max(points // 100, 1), dim)).astype(np.float32)
+    def sample(count):
+        assigned = centroids[rng.integers(0, len(centroids), count)]
+        return normalize(assigned + 0.6 * rng.standard_normal((count, dim)).astype(np.float32))
+    return sample(points), sample(queries)
+
+
+def collection_vectors(client: QdrantClient, name: str, points: int, queries: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Real vectors from an existing collection; the first ``queries`` are held out as queries"""
+    vectors = []
+    offset = None
+    while len(vectors) < points + queries:
+        records, offset = client.scroll(name, limit=1000, offset=offset, with_vectors=True, with_payload=False)
+        vectors.extend(record.vector for record in records)
+        if offset is None:
+            break
+    vectors = normalize(np.asarray(vectors, dtype=np.float32))
+    if len(vectors) <= queries:
+        raise SystemExit(f"{name} holds {len(vectors)} vectors, need more than --queries {queries}")
+    return vectors[queries:queries + points], vectors[:queries]
+
+
+def estimated_ram_mb(profile: CollectionProfile, points: int, dim: int) -> float:
+    size = 0 if profile.on_disk else points * dim * 4
+    if profile.quantization == "scalar" and profile.quantization_always_ram:
+        size += points * dim
+    elif profile.quantization == "binary" and profile.quantization_always_ram:
+        size += points * dim / 8
+    # Level 0 keeps up to 2 * m links per point, 4 bytes each
+    size += points * 2 * (profile.hnsw_m or 16) * 4
+    return round(size / 1024 / 1024, 1)
+
+
+def load(client: QdrantClient, name: str, profile: CollectionProfile, vectors: np.ndarray, timeout: float):
+    create_collection(
+        client, name, vectors.shape[1], profile,
+        # Build the HNSW index right away rather than once segments pass the default size
+        optimizers_config=OptimizersConfigDiff(indexing_threshold=1),
+    )
+    for start in range(0, len(vectors), 1000):
+        batch = vectors[start:start + 1000]
+        client.upsert(name, points=[
+            PointStruct(id=start + i, vector=vector.tolist()) for i, vector in enumerate(batch)
+        ], wait=True)
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        info = client.get_collection(name)
+        if info.status == CollectionStatus.GREEN and (info.indexed_vectors_count or 0) >= len(vectors):
+            return
+        time.sleep(0.5)
+    raise SystemExit(f"{name} was not indexed within {timeout}s")
+
+
+def run(client: QdrantClient, name: str, search: SearchProfile, queries: np.ndarray, truth: List[set], top_k: int):
+    params = search.params()
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        points = client.query_points(name, query=query.tolist(), limit=top_k, search_params=params).points
+        latencies.append(time.perf_counter() - start)
+        hits += len(expected & {point.id for point in points})
+    latencies = np.asarray(latencies) * 1000
+    return {
+        f"recall@{top_k}": round(hits / (len(queries) * top_k), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=settings.qdrant_host)
+    parser.add_argument("--port", type=int, default=settings.qdrant_port)
+    parser.add_argument("--from-collection", help="benchmark on vectors scrolled from this collection")
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--hnsw-m", type=int)
+    parser.add_argument("--hnsw-ef-construct", type=int)
+    parser.add_argument("--hnsw-ef", type=int, help="query-time ef for every profile")
+    parser.add_argument("--oversampling", type=float, default=2.0)
+    parser.add_argument("--profiles", nargs="+", help="subset of profiles to run")
+    parser.add_argument("--index-timeout", type=float, default=600)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    client = QdrantClient(host=args.host, port=args.port, timeout=60, check_compatibility=False)
+    if args.from_collection:
+        vectors, queries = collection_vectors(client, args.from_collection, args.points, args.queries)
+    else:
+        vectors, queries = synthetic_vectors(args.points, args.queries, args.dim)
+
+    # Exact neighbours by cosine similarity, vectors are unit length
+    scores = queries @ vectors.T
+    truth = [set(row.tolist()) for row in np.argsort(-scores, axis=1)[:, :args.top_k]]
+
+    selected = profiles(args)
+    if args.profiles:
+        selected = {name: selected[name] for name in args.profiles}
+
+    results = []
+    # Profiles differing only in search settings share one collection
+    built: Dict[CollectionProfile, str] = {}
+    try:
+        for name, (profile, search) in selected.items():
+            if profile not in built:
+                built[profile] = f"bench_{uuid.uuid4().hex[:8]}"
+                load(client, built[profile], profile, vectors, args.index_timeout)
+            row = {
+                "profile": name,
+                "quantization": profile.quantization,
+                "on_disk": profile.on_disk,
+                "rescore": search.rescore,
+                "est_ram_mb": estimated_ram_mb(profile, len(vectors), vectors.shape[1]),
+            }
+            row.update(run(client, built[profile], search, queries, truth, args.top_k))
+            results.append(row)
+    finally:
+        for collection in built.values():
+            client.delete_collection(collection)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    recall = f"recall@{args.top_k}"
+    print(f"{'profile':>17} {'quant':>7} {'on_disk':>8} {'rescore':>8} {'ram_mb':>8} {recall:>10} {'p50_ms':>7} {'p95_ms':>7}")
+    for row in results:
+        print(
+            f"{row['profile']:>17} {row['quantization']:>7} {str(row['on_disk']):>8} {str(row['rescore']):>8} "
+            f"{row['est_ram_mb']:>8} {row[recall]:>10} {row['p50_ms']:>7} {row['p95_ms']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+from app.services.chunking import get_chunking_policy, recursive_split_text, sentence_split_text
+from benchmarks.chunking_benchmark import (
+    legacy_recursive_split_text,
+    legacy_sentence_split_text,
+    synthetic_text,
+)
+
+# Separators are over-represented so runs of them, leading/trailing ones and
+# punctuation without following whitespace all show up often
+TOKENS = ["lorem", "ipsum", "a", "xyz", " ", " ", "  ", ".", ". ", "!", "? ", "\n", "\n\n", "\n\n\n", "\t", " \n"]
+
+STRATEGIES = [
+    ("recursive", recursive_split_text, legacy_recursive_split_text),
+    ("sentence", sentence_split_text, legacy_sentence_split_text),
+]
+
+
+def random_text(rng: random.Random) -> str:
+    return "".join(rng.choice(TOKENS) for _ in range(rng.randint(0, 300)))
+
+
+@pytest.mark.parametrize("strategy, split_text, legacy", STRATEGIES, ids=[name for name, *_ in STRATEGIES])
+def test_matches_legacy_on_random_text(strategy, split_text, legacy):
+    rng = random.Random(strategy)
+    for _ in range(3000):
+        text = random_text(rng)
+        chunk_size = rng.randint(1, 120)
+        chunk_overlap = rng.randint(0, chunk_size)
+
+        expected = legacy(text, chunk_size, chunk_overlap)
+        assert split_text(text, chunk_size, chunk_overlap) == expected, (text, chunk_size, chunk_overlap)
+        spans = get_chunking_policy(strategy, chunk_size, chunk_overlap).spans(text)
+        assert [span.text(text) for span in spans] == expected
+
+
+@pytest.mark.parametrize("strategy, split_text, legacy", STRATEGIES, ids=[name for name, *_ in STRATEGIES])
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(200, 0), (1000, 200), (4000, 200)])
+def test_matches_legacy_on_prose(strategy, split_text, legacy, chunk_size, chunk_overlap):
+    text = synthetic_text(200_000, seed=chunk_size)
+    assert split_text(text, chunk_size, chunk_overlap) == legacy(text, chunk_size, chunk_overlap)
@@ -0,0 +1,186 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+
+from app.core.mmap_index import MmapVectorStore
+from app.core.vector_store import VectorPoint, VectorStore
+
+DIMENSION = 16
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def open_store(path, **kwargs) -> MmapVectorStore:
+    store = MmapVectorStore(str(path), **kwargs)
+    run(store.init(DIMENSION))
+    return store
+
+
+def random_vectors(count: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(count, DIMENSION)).astype(np.float32)
+
+
+def points(vectors: np.ndarray, doc_id: int = 1, prefix: str = "p") -> list:
+    return [
+        VectorPoint(id=f"{prefix}{i}", vector=vector, payload={"doc_id": doc_id, "chunk_index": i})
+        for i, vector in enumerate(vectors)
+    ]
+
+
+def test_incomplete_backend_fails_when_created():
+    class SearchOnly(VectorStore):
+        async def search(self, vector, top_k=3, document_ids=None):
+            return []
+
+    with pytest.raises(TypeError):
+        SearchOnly()
+
+
+def test_upsert_and_search_round_trip(tmp_path):
+    store = open_store(tmp_path)
+    vectors = random_vectors(50)
+    run(store.upsert(points(vectors)))
+
+    hits = run(store.search(vectors[7], top_k=3))
+    assert hits[0].id == "p7"
+    assert hits[0].score == pytest.approx(1.0, abs=1e-5)
+    assert hits[0].payload == {"doc_id": 1, "chunk_index": 7}
+    assert [hit.score for hit in hits] == sorted((hit.score for hit in hits), reverse=True)
+
+    batch = run(store.search_batch([vectors[1], vectors[2]], top_k=1))
+    assert [hits[0].id for hits in batch] == ["p1", "p2"]
+
+
+def test_upsert_replaces_existing_ids(tmp_path):
+    store = open_store(tmp_path, compact_ratio=1.0)
+    vectors = random_vectors(10)
+    run(store.upsert(points(vectors)))
+
+    replacement = random_vectors(1, seed=1)[0]
+    run(store.upsert([VectorPoint(id="p3", vector=replacement, payload={"doc_id": 1, "chunk_index": 99})]))
+
+    hits = run(store.search(replacement, top_k=10))
+    assert [hit.id for hit in hits].count("p3") == 1
+    assert hits[0].id == "p3"
+    assert hits[0].payload["chunk_index"] == 99
+    assert store.stats()["live"] == 10
+
+
+def test_duplicate_ids_within_one_batch_keep_the_last(tmp_path):
+    store = open_store(tmp_path, compact_ratio=1.0)
+    first, second = random_vectors(2)
+    run(store.upsert([
+        VectorPoint(id="a", vector=first, payload={"doc_id": 1, "version": 1}),
+        VectorPoint(id="a", vector=second, payload={"doc_id": 1, "version": 2}),
+    ]))
+
+    hits = run(store.search(second, top_k=5))
+    assert [hit.id for hit in hits] == ["a"]
+    assert hits[0].payload["version"] == 2
+
+
+def test_delete_document_and_filter(tmp_path):
+    store = open_store(tmp_path, compact_ratio=1.0)
+    run(store.upsert(points(random_vectors(5, seed=1), doc_id=1, prefix="a")))
+    run(store.upsert(points(random_vectors(5, seed=2), doc_id=2, prefix="b")))
+    query = random_vectors(1, seed=3)[0]
+
+    scoped = run(store.search(query, top_k=10, document_ids=[2]))
+    assert {hit.id for hit in scoped} == {f"b{i}" for i in range(5)}
+
+    run(store.delete_document(2))
+    remaining = run(store.search(query, top_k=10))
+    assert {hit.id for hit in remaining} == {f"a{i}" for i in range(5)}
+    assert run(store.search(query, top_k=10, document_ids=[2])) == []
+
+
+def test_reopen_drops_torn_log_tail(tmp_path):
+    store = open_store(tmp_path)
+    vectors = random_vectors(20)
+    run(store.upsert(points(vectors)))
+
+    # A writer that crashed after appending but before committing the manifest
+    generation = store.stats()["generation"]
+    with open(tmp_path / f"vectors-{generation}.bin", "ab") as f:
+        f.write(b"\x00" * 7)
+    with open(tmp_path / f"log-{generation}.jsonl", "ab") as f:
+        f.write(b'{"op": "add", "id": "torn", "payl')
+
+    reopened = open_store(tmp_path)
+    assert reopened.stats()["rows"] == 20
+    assert run(reopened.search(vectors[4], top_k=1))[0].id == "p4"
+
+    # Writes after recovery land on clean offsets
+    extra = random_vectors(1, seed=9)
+    run(reopened.upsert(points(extra, prefix="x")))
+    assert run(reopened.search(extra[0], top_k=1))[0].id == "x0"
+    assert run(open_store(tmp_path).search(extra[0], top_k=1))[0].payload == {"doc_id": 1, "chunk_index": 0}
+
+
+def test_compaction_keeps_live_rows(tmp_path):
+    store = open_store(tmp_path, compact_ratio=0.3)
+    run(store.upsert(points(random_vectors(10, seed=1), doc_id=1, prefix="a")))
+    run(store.upsert(points(random_vectors(10, seed=2), doc_id=2, prefix="b")))
+    kept = random_vectors(10, seed=2)
+
+    run(store.delete_document(1))
+
+    stats = store.stats()
+    assert stats["generation"] == 1
+    assert stats["rows"] == stats["live"] == 10
+    assert not os.path.exists(tmp_path / "vectors-0.bin")
+    assert not os.path.exists(tmp_path / "log-0.jsonl")
+    for i, vector in enumerate(kept):
+        hit = run(store.search(vector, top_k=1))[0]
+        assert hit.id == f"b{i}"
+        assert hit.payload == {"doc_id": 2, "chunk_index": i}
+
+
+def test_other_instances_see_writes_and_compactions(tmp_path):
+    writer = open_store(tmp_path, compact_ratio=0.3)
+    reader = open_store(tmp_path)
+    vectors = random_vectors(10)
+    run(writer.upsert(points(vectors, doc_id=1)))
+    assert run(reader.search(vectors[2], top_k=1))[0].id == "p2"
+
+    others = random_vectors(10, seed=5)
+    run(writer.upsert(points(others, doc_id=2, prefix="q")))
+    run(writer.delete_document(1))
+    assert reader.stats()["generation"] == 0
+    assert run(reader.search(others[3], top_k=1))[0].id == "q3"
+    assert reader.stats()["generation"] == 1
+
+
+def clustered_vectors(count: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, DIMENSION))
+    members = centers[rng.integers(clusters, size=count)]
+    return (members + 0.3 * rng.normal(size=(count, DIMENSION))).astype(np.float32)
+
+
+def test_ivf_recall_against_exact_search(tmp_path):
+    vectors = clustered_vectors(3000, clusters=30)
+    queries = clustered_vectors(50, clusters=30, seed=1)
+
+    exact = open_store(tmp_path / "exact")
+    ivf = open_store(tmp_path / "ivf", ivf_min_points=1000, ivf_lists=32, ivf_probe=8)
+    for start in range(0, len(vectors), 500):
+        batch = vectors[start:start + 500]
+        run(exact.upsert(points(batch, prefix=f"{start}-")))
+        run(ivf.upsert(points(batch, prefix=f"{start}-")))
+
+    assert ivf.stats()["ivf_lists"] == 32
+    assert exact.stats()["ivf_lists"] == 0
+
+    top_k = 10
+    expected = run(exact.search_batch(list(queries), top_k=top_k))
+    found = run(ivf.search_batch(list(queries), top_k=top_k))
+    recall = np.mean([
+        len({hit.id for hit in got} & {hit.id for hit in want}) / top_k
+        for got, want in zip(found, expected)
+    ])
+    assert recall >= 0.9
@@ -0,0 +1,20 @@
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app.core.config import Settings
+from app.models.document import TextChunk
+
+settings = Settings()
+
+
+def test_text_chunks_ddl_compiles_for_postgresql():
+    dialect = postgresql.dialect()
+    table = TextChunk.__table__
+
+    assert "CREATE TABLE text_chunks" in str(CreateTable(table).compile(dialect=dialect))
+    statements = {index.name: str(CreateIndex(index).compile(dialect=dialect)) for index in table.indexes}
+    # Same expression as Retriever.lexical_search, so the planner can use the index
+    assert (
+        f"USING gin (to_tsvector('{settings.text_search_config}'::regconfig, content))"
+        in statements["ix_text_chunks_content_tsv"]
+    )